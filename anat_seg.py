@@ -5,14 +5,13 @@
 Command line options override default settings.
 """
 import sys
-import argparse
 
-from typing import Any, Dict, List, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
-from anat_seg.seg import segmentation
 from anat_seg import __version__
-from anat_seg.utils.commandio.commandio.workdir import WorkDir
-from anat_seg.utils.commandio.commandio.logutil import LogFile
+
+if TYPE_CHECKING:
+    import argparse
 
 
 def main() -> None:
@@ -20,50 +19,61 @@ def main() -> None:
     return None
 
 
-def proc() -> List[str]:
-    args, parser = arg_parser()
+# Command line flags mapped to their destination and type. Boolean (i.e.
+# ``store_true``) flags are mapped to ``True``, and repeatable flags to ``list``.
+_FLAGS: Dict[str, Tuple[str, Any]] = {
+    '-i': ('image', str),
+    '--image': ('image', str),
+    '-o': ('out', str),
+    '--output-dir': ('out', str),
+    '-f': ('frac_int', float),
+    '--frac-int': ('frac_int', float),
+    '--N4': ('N4', True),
+    '--no-bias': ('no_bias', True),
+    '--force': ('force', True),
+    '-t': ('intype', int),
+    '--type': ('intype', int),
+    '-c': ('classes', int),
+    '--classes': ('classes', int),
+    '-p': ('priors', list),
+    '--priors': ('priors', list),
+    '--neonate': ('neonate', True),
+}
+
+# Default settings for each mode (if not specified at the command line)
+_MODE_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    'neonate': {'frac_int': 0.3, 'intype': 2, 'classes': 5},
+    'adult': {'frac_int': 0.5, 'intype': 1, 'classes': 3},
+}
 
-    # Print help message in the case of no arguments
-    if len(sys.argv) == 1:
-        parser.print_help(sys.stderr)
-        sys.exit(1)
-    else:
-        args: Dict[str, Any] = vars(args)
 
-    # Set defaults
+def proc() -> List[str]:
+    args: Optional[Dict[str, Any]] = fast_parse(sys.argv[1:])
+
+    # Defer to argparse for help messages and argument errors
+    if args is None:
+        args, parser = arg_parser()
+
+        # Print help message in the case of no arguments
+        if len(sys.argv) == 1:
+            parser.print_help(sys.stderr)
+            sys.exit(1)
+        else:
+            args: Dict[str, Any] = vars(args)
+
+    # Set defaults (parsed arguments take precedence over mode defaults)
+    args['nobias'] = args.pop('no_bias', None)
+    mode: str = 'neonate' if args.get('neonate') else 'adult'
     defaults: Dict[str, Any] = {
-        'image': args.get('image'),
-        'out': args.get('out'),
-        'frac_int': args.get('frac_int'),
-        'N4': args.get('N4'),
-        'nobias': args.get('no_bias'),
-        'intype': args.get('intype'),
-        'classes': args.get('classes'),
-        'priors': args.get('priors'),
-        'neonate': args.get('neonate'),
-        'log': args.get('log'),
+        **_MODE_DEFAULTS[mode],
+        **{k: v for k, v in args.items() if v is not None},
     }
 
-    if defaults.get('neonate'):
-
-        if defaults.get('frac_int') is None:
-            defaults['frac_int'] = 0.3
-
-        if defaults.get('intype') is None:
-            defaults['intype'] = 2
-
-        if defaults.get('classes') is None:
-            defaults['classes'] = 5
-    else:
-
-        if defaults.get('frac_int') is None:
-            defaults['frac_int'] = 0.5
-
-        if defaults.get('intype') is None:
-            defaults['intype'] = 1
-
-        if defaults.get('classes') is None:
-            defaults['classes'] = 3
+    # NOTE: Imported here so that help messages and argument errors do not
+    #   incur the (import) cost of the segmentation pipeline.
+    from anat_seg.seg import segmentation
+    from anat_seg.utils.commandio.commandio.workdir import WorkDir
+    from anat_seg.utils.commandio.commandio.logutil import LogFile
 
     with WorkDir(defaults.get('out')) as od:
         _log_file: str = od.join('anat_seg.log')
@@ -75,14 +85,88 @@ def proc() -> List[str]:
     return seg_list
 
 
+def fast_parse(argv: List[str]) -> Optional[Dict[str, Any]]:
+    """Lightweight CLI argument parser.
+
+    Parses the command line arguments in a single pass, without the overhead
+    of constructing an ``argparse.ArgumentParser``.
+
+    NOTE: 
+        * ``None`` is returned for any arguments that cannot be parsed (e.g. 
+            help flags, unknown/abbreviated flags, missing required arguments),
+            in which case ``arg_parser`` should be used instead.
+
+    Args:
+        argv: Command line arguments (excluding the program name).
+
+    Returns:
+        Dictionary of parsed arguments (identical to that of ``arg_parser``), 
+            or None.
+    """
+    args: Dict[str, Any] = {
+        'image': None,
+        'out': None,
+        'frac_int': None,
+        'N4': False,
+        'no_bias': False,
+        'force': False,
+        'intype': None,
+        'classes': None,
+        'priors': None,
+        'neonate': False,
+    }
+    priors: List[str] = []
+    pending: Optional[Tuple[str, Any]] = None
+
+    for tok in argv:
+        if pending is None:
+            flag, eq, value = tok.partition('=')
+            spec: Optional[Tuple[str, Any]] = _FLAGS.get(flag)
+
+            if spec is None:
+                return None
+            elif spec[1] is True:
+                if eq:
+                    return None
+                args[spec[0]] = True
+                continue
+            elif not eq:
+                pending = spec
+                continue
+        else:
+            if tok.startswith('-'):
+                return None
+            spec, value, pending = pending, tok, None
+
+        dest, _type = spec
+
+        if _type is list:
+            priors.append(value)
+        else:
+            try:
+                args[dest] = _type(value)
+            except ValueError:
+                return None
+
+    if pending is not None or args['image'] is None or args['out'] is None:
+        return None
+
+    if priors:
+        args['priors'] = priors
+
+    return args
+
+
 def arg_parser() -> Tuple[
-    argparse.ArgumentParser.parse_args, argparse.ArgumentParser
+    "argparse.ArgumentParser.parse_args", "argparse.ArgumentParser"
 ]:
     """CLI Argument parser.
     
     Returns:
         Tuple of ``argparse`` objects.
     """
+    import argparse
+
     # Init parser
     parser: argparse.ArgumentParser = argparse.ArgumentParser(
         description=__doc__,
@@ -147,6 +231,15 @@ def arg_parser() -> Tuple[
         help="Do not perform bias correction [default: False].",
     )
 
+    optoptions.add_argument(
+        "--force",
+        action="store_true",
+        dest="force",
+        default=False,
+        required=False,
+        help="Re-compute the bias field correction, even if (up to date) outputs from a previous run exist [default: False].",
+    )
+
     optoptions.add_argument(
         "-t",
         "--type",
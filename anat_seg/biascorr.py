@@ -4,31 +4,41 @@
 This module is a wrapper for ``FSL``'s ``FAST`` and ``ANTs``'s 
 ``N4BiasFieldCorrection``.
 """
+import json
+import math
 import os
-from typing import Tuple, Union
-
-from utils.commandio.commandio.command import Command, DependencyError
-from utils.commandio.commandio.fileio import File
-from utils.commandio.commandio.logutil import LogFile
-from utils.commandio.commandio.workdir import WorkDir
-from utils.commandio.commandio.tmpdir import TmpDir
-from utils.commandio.commandio.tmpfile import TmpFile
-from utils.commandio.commandio.util import timeops
-from utils.niio import NiiFile
-from fsl.bet import bet
-
-
-# Globlally define (temporary) log file object
-# NOTE: Not the best practice in this scenario, but
-#   it gets the job done.
-with TmpFile(tmp_dir=os.getcwd(), ext=".log") as tmpf:
-    log: LogFile = LogFile(log_file=tmpf.src)
-    tmpf.remove()
-
-
-@timeops(log=log)
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import nibabel as nib
+import numpy as np
+
+from anat_seg.utils.commandio.commandio.command import DependencyError
+from anat_seg.utils.commandio.commandio.fileio import File
+from anat_seg.utils.commandio.commandio.logutil import LogFile
+from anat_seg.utils.commandio.commandio.workdir import WorkDir
+from anat_seg.utils.commandio.commandio.tmpdir import TmpDir
+from anat_seg.utils.niio import NiiFile, fsl_ext, nii_abspath
+from anat_seg.utils.util import (
+    check_dependency,
+    lazy_timeops,
+    run_command,
+    which,
+)
+from anat_seg.fsl.bet import bet
+from anat_seg.fsl.fslmaths import fslmaths
+
+
+@lazy_timeops
 def biascorr(
-    image: str, out: str, N4: bool = False, log: Union[str, LogFile] = None
+    image: str,
+    out: str,
+    N4: bool = False,
+    n4_iters: str = "50x40x30",
+    n4_shrink: int = 4,
+    n4_spline: Union[int, float, str] = "200",
+    force: bool = False,
+    log: Union[str, LogFile] = None,
 ) -> Tuple[str, str]:
     """Performs bias field correction.
 
@@ -44,6 +54,10 @@ def biascorr(
         image: Input image NIFTI file.
         out: Output image prefix.
         N4: Use N4 bias field correction. Defaults to False.
+        n4_iters: N4 iterations at each resolution level. Defaults to "50x40x30".
+        n4_shrink: N4 image shrink factor. Defaults to 4.
+        n4_spline: N4 B-spline distance (in mm), or mesh size. Defaults to "200".
+        force: Perform bias field correction, even if the (up to date) outputs already exist (i.e. computed with the same method and parameters, as recorded in ``{out}_biascorr.json``). Defaults to False.
         log: ``LogFile`` object or path to log file. Defaults to None.
 
     Returns:
@@ -51,14 +65,24 @@ def biascorr(
             corresponding bias field.
     """
     if N4:
-        restore, biasfield = _N4_biascorr(image=image, out=out, log=log)
+        restore, biasfield = _N4_biascorr(
+            image=image,
+            out=out,
+            n4_iters=n4_iters,
+            n4_shrink=n4_shrink,
+            n4_spline=n4_spline,
+            force=force,
+            log=log,
+        )
     else:
-        restore, biasfield = _fsl_biascorr(image=image, out=out, log=log)
+        restore, biasfield = _fsl_biascorr(
+            image=image, out=out, force=force, log=log
+        )
     return restore, biasfield
 
 
 def _fsl_biascorr(
-    image: str, out: str, log: Union[str, LogFile] = None
+    image: str, out: str, force: bool = False, log: Union[str, LogFile] = None
 ) -> Tuple[str, str]:
     """Performs FSL's bias field correction.
 
@@ -70,31 +94,59 @@ def _fsl_biascorr(
     Args:
         image: Input image NIFTI file.
         out: Output image prefix.
+        force: Perform bias field correction, even if the (up to date) outputs already exist (i.e. computed with the same method and parameters, as recorded in ``{out}_biascorr.json``). Defaults to False.
         log: ``LogFile`` object or path to log file. Defaults to None.
 
     Returns:
         Tuple of strings that correspond to bias field corrected image and the 
             corresponding bias field.
     """
-    with NiiFile(src=image, assert_exists=True, validate_nifti=True) as img:
-        image: str = img.abspath()
+    image: str = nii_abspath(image)
 
     with File(src=out) as f:
         out: str = f.rm_ext()
         outdir, _, _ = f.file_parts()
 
+    # NOTE: The output file extension is set by ``FSLOUTPUTTYPE``.
+    ext: str = fsl_ext()
+
+    restore: str = os.path.abspath(f"{out}_restore{ext}")
+    biasfield: str = os.path.abspath(f"{out}_bias_field{ext}")
+
+    # NOTE: The outputs are only re-used if they were computed by the same
+    #   method (and from the same, unmodified, input image).
+    params_file: str = os.path.abspath(f"{out}_biascorr.json")
+    params: Dict[str, Any] = {"method": "fsl", **_file_params(image)}
+
+    if not force and _up_to_date(
+        image, restore, biasfield, params_file=params_file, params=params
+    ):
+        return restore, biasfield
+
+    _remove(params_file)
+
     with WorkDir(src=outdir) as od:
         with TmpDir(src=od.abspath()) as td:
             tmpout: str = td.join("fast")
 
-            cmd: str = f"fast -b -B -o {tmpout} {image}"
+            # NOTE: Partial volume estimation is not needed for the bias field
+            #   and bias corrected outputs.
+            cmd: List[str] = [
+                "fast",
+                "-b",
+                "-B",
+                "--nopve",
+                "-o",
+                tmpout,
+                image,
+            ]
+
+            check_dependency("fast")
 
-            fast: Command = Command(cmd)
-            fast.check_dependency()
-            fast.run(log=log)
+            run_command(cmd, log=log)
 
-            tmp_restore: str = f"{tmpout}_restore.nii.gz"
-            tmp_biasfield: str = f"{tmpout}_bias_field.nii.gz"
+            tmp_restore: str = f"{tmpout}_restore{ext}"
+            tmp_biasfield: str = f"{tmpout}_bias_field{ext}"
 
             with NiiFile(
                 src=tmp_restore, assert_exists=True, validate_nifti=True
@@ -102,25 +154,40 @@ def _fsl_biascorr(
                 with NiiFile(
                     src=tmp_biasfield, assert_exists=True, validate_nifti=True
                 ) as bs:
-                    restore: str = rs.copy(f"{out}_restore.nii.gz")
-                    biasfield: str = bs.copy(f"{out}_bias_field.nii.gz")
+                    restore: str = _move(rs.abspath(), restore)
+                    biasfield: str = _move(bs.abspath(), biasfield)
+
+    _write_params(params_file, params)
 
     return restore, biasfield
 
 
 def _N4_biascorr(
-    image: str, out: str, log: Union[str, LogFile] = None
+    image: str,
+    out: str,
+    n4_iters: str = "50x40x30",
+    n4_shrink: int = 4,
+    n4_spline: Union[int, float, str] = "200",
+    force: bool = False,
+    log: Union[str, LogFile] = None,
 ) -> Tuple[str, str]:
     """Performs N4 bias field correction.
 
     NOTE: Input image **SHOULD NOT** be skull-stripped.
 
+    NOTE: Finer (and slower) schedules can be specified for higher precision,
+        e.g. ``n4_iters="50x50x50"``, ``n4_shrink=2``, and ``n4_spline="100"``.
+
     Usage example:
         >>>
 
     Args:
         image: Input image NIFTI file.
         out: Output image prefix.
+        n4_iters: Iterations at each resolution level. Defaults to "50x40x30".
+        n4_shrink: Image shrink factor. Defaults to 4.
+        n4_spline: B-spline distance (in mm), or mesh size. Defaults to "200".
+        force: Perform bias field correction, even if the (up to date) outputs already exist (i.e. computed with the same method and parameters, as recorded in ``{out}_biascorr.json``). Defaults to False.
         log: ``LogFile`` object or path to log file. Defaults to None.
 
     Raises:
@@ -131,47 +198,132 @@ def _N4_biascorr(
         Tuple of strings that correspond to bias field corrected image and the 
             corresponding bias field.
     """
-    with NiiFile(src=image, assert_exists=True, validate_nifti=True) as img:
-        image: str = img.abspath()
+    image: str = nii_abspath(image)
 
     with File(src=out) as f:
         if out.endswith('.nii.gz') or out.endswith('.nii'):
             out: str = f.rm_ext()
         outdir, _, _ = f.file_parts()
 
+    # NOTE: The output file extension is set by ``FSLOUTPUTTYPE``.
+    ext: str = fsl_ext()
+
+    restore: str = os.path.abspath(f"{out}_restore{ext}")
+    biasfield: str = os.path.abspath(f"{out}_bias_field{ext}")
+
+    # NOTE: The outputs are only re-used if they were computed by the same
+    #   method, with the same parameters (and from the same, unmodified,
+    #   input image).
+    params_file: str = os.path.abspath(f"{out}_biascorr.json")
+    params: Dict[str, Any] = {
+        "method": "N4",
+        **_file_params(image),
+        "n4_iters": str(n4_iters),
+        "n4_shrink": int(n4_shrink),
+        "n4_spline": str(n4_spline),
+    }
+
+    if not force and _up_to_date(
+        image, restore, biasfield, params_file=params_file, params=params
+    ):
+        return restore, biasfield
+
+    _remove(params_file)
+
     with WorkDir(src=outdir) as od:
         with TmpDir(src=od.abspath()) as td:
             tmpout: str = td.join("brain.nii.gz")
 
-            _, mask = bet(
-                image=image, out=tmpout, frac_int=0.1, mask=True, log=log
-            )
-
-            _cmd1: Command = Command("N4BiasFieldCorrection")
-            _cmd2: Command = Command("N4")
+            # NOTE: Only the brain mask is needed for N4, so brain extraction
+            #   is performed in the background while the N4 command is
+            #   constructed.
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                _bet: Future = executor.submit(
+                    bet,
+                    image=image,
+                    out=tmpout,
+                    frac_int=0.1,
+                    mask=True,
+                    log=log,
+                )
 
-            # NOTE: Dependency check is performed here as N4BiasFieldCorrection
-            #   (installed via ANTs) can also be installed as just N4 (via dHCP
-            #   structural pipleline). Both are checked here.
-            if _cmd1.check_dependency(raise_exc=False):
-                cmd: str = f"{_cmd1.command}"
-            elif _cmd2.check_dependency(raise_exc=False):
-                cmd: str = f"{_cmd2.command}"
+                # NOTE: N4 is performed in-process (via SimpleITK) if it is
+                #   installed, otherwise the N4 executable is used.
+                try:
+                    import SimpleITK  # noqa: F401
+
+                    inproc: bool = True
+                except ImportError:
+                    inproc: bool = False
+
+                # NOTE: Dependency check is performed here as N4BiasFieldCorrection
+                #   (installed via ANTs) can also be installed as just N4 (via dHCP
+                #   structural pipleline). Both are checked here.
+                exe: Optional[str] = None
+                if not inproc:
+                    exe: Optional[str] = which("N4BiasFieldCorrection")
+                    exe: Optional[str] = exe or which("N4")
+
+                    if exe is None:
+                        raise DependencyError(
+                            "N4BiasFieldCorrection is not installed or in system PATH variable."
+                        )
+
+                # Create output filenames
+                tmp_rest: str = td.join(f"restore{ext}")
+                tmp_bias: str = td.join(f"bias{ext}")
+
+                _, mask = _bet.result()
+
+            if inproc:
+                _N4_biascorr_inproc(
+                    image=image,
+                    mask=mask,
+                    restore=tmp_rest,
+                    biasfield=tmp_bias,
+                    n4_iters=n4_iters,
+                    n4_shrink=n4_shrink,
+                    n4_spline=n4_spline,
+                    log=log,
+                )
             else:
-                raise DependencyError(
-                    f"{_cmd1.command} is not installed or in system PATH variable."
+                # NOTE: ANTs' N4 already computes in single precision, but
+                #   the mask is cast to uint8 as non-integer masks can cause
+                #   N4 to fail (segfault).
+                mask: str = fslmaths(mask).run(
+                    out=td.join("mask_uint8.nii.gz"), odt="char", log=log
                 )
 
-            # Create output filenames
-            tmp_rest: str = td.join("restore.nii.gz")
-            tmp_bias: str = td.join("bias.nii.gz")
-
-            # Construct command
-            cmd: str = f"{cmd} -i {image} -x {mask} -o \"[{tmp_rest},{tmp_bias}]\" \
-                -c \"[50x50x50,0.001]\" -s 2 -b \"[100,3]\" -t \"[0.15,0.01,200]\""
-
-            N4: Command = Command(cmd)
-            N4.run(log=log)
+                # Construct command
+                cmd: List[str] = [
+                    exe,
+                    "-i",
+                    image,
+                    "-x",
+                    mask,
+                    "-o",
+                    f"[{tmp_rest},{tmp_bias}]",
+                    "-c",
+                    f"[{n4_iters},1e-6]",
+                    "-s",
+                    str(int(n4_shrink)),
+                    "-b",
+                    f"[{n4_spline},3]",
+                ]
+
+                # Multi-thread N4 (unless the number of threads is set by the user)
+                env: Dict[str, str] = {}
+                if "ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS" not in os.environ:
+                    env["ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS"] = str(
+                        os.cpu_count() or 1
+                    )
+
+                run_command(cmd, log=log, env=env)
+
+            # Constrain the global gain of the bias field
+            _normalize_bias_field(
+                restore=tmp_rest, biasfield=tmp_bias, mask=mask
+            )
 
             # Verify and validate output NIFTI files
             with NiiFile(
@@ -180,8 +332,221 @@ def _N4_biascorr(
                 with NiiFile(
                     src=tmp_bias, assert_exists=True, validate_nifti=True
                 ) as bs:
-                    restore: str = rs.copy(f"{out}_restore.nii.gz")
-                    biasfield: str = bs.copy(f"{out}_bias_field.nii.gz")
+                    restore: str = _move(rs.abspath(), restore)
+                    biasfield: str = _move(bs.abspath(), biasfield)
+
+    _write_params(params_file, params)
 
     return restore, biasfield
 
+
+def _N4_biascorr_inproc(
+    image: str,
+    mask: str,
+    restore: str,
+    biasfield: str,
+    n4_iters: str = "50x40x30",
+    n4_shrink: int = 4,
+    n4_spline: Union[int, float, str] = "200",
+    log: Union[str, LogFile] = None,
+) -> Tuple[str, str]:
+    """Performs N4 bias field correction in-process using ``SimpleITK``.
+
+    NOTE: The parameters are the same as those of the N4 executable, such that
+        either implementation produces comparable outputs.
+
+    Args:
+        image: Input image NIFTI file.
+        mask: Brain mask NIFTI file.
+        restore: Output bias field corrected image file.
+        biasfield: Output bias field file.
+        n4_iters: Iterations at each resolution level. Defaults to "50x40x30".
+        n4_shrink: Image shrink factor. Defaults to 4.
+        n4_spline: B-spline distance (in mm), or mesh size. Defaults to "200".
+        log: ``LogFile`` object or path to log file. Defaults to None.
+
+    Returns:
+        Tuple of strings that correspond to bias field corrected image and the
+            corresponding bias field.
+    """
+    import SimpleITK as sitk
+
+    if isinstance(log, str):
+        log: LogFile = LogFile(log_file=log)
+
+    if log:
+        log.info(f"Running:\tSimpleITK N4 bias field correction on {image}")
+
+    img = sitk.ReadImage(image, sitk.sitkFloat32)
+    msk = sitk.ReadImage(mask, sitk.sitkUInt8)
+
+    # Fit the bias field on the shrunken image (as done by N4 with -s)
+    shrink: List[int] = [int(n4_shrink)] * img.GetDimension()
+    _img = sitk.Shrink(img, shrink)
+    _msk = sitk.Shrink(msk, shrink)
+
+    # NOTE: N4 specifies the B-spline mesh with either the distance between
+    #   knots (in mm), or the mesh size (e.g. 1x1x1). Both are converted to
+    #   the number of control points (mesh size + spline order) here.
+    order: int = 3
+    n4_spline: str = str(n4_spline)
+    if "x" in n4_spline:
+        mesh: List[int] = [int(m) for m in n4_spline.split("x")]
+    else:
+        mesh: List[int] = [
+            max(1, math.ceil(sp * (sz - 1) / float(n4_spline)))
+            for sp, sz in zip(img.GetSpacing(), img.GetSize())
+        ]
+
+    corr = sitk.N4BiasFieldCorrectionImageFilter()
+    corr.SetMaximumNumberOfIterations(
+        [int(i) for i in str(n4_iters).split("x")]
+    )
+    corr.SetConvergenceThreshold(1e-6)
+    corr.SetSplineOrder(order)
+    corr.SetNumberOfControlPoints([m + order for m in mesh])
+    corr.Execute(_img, _msk)
+
+    # Reconstruct the bias field at full resolution
+    bias = sitk.Exp(corr.GetLogBiasFieldAsImage(img))
+
+    sitk.WriteImage(sitk.Divide(img, bias), restore)
+    sitk.WriteImage(bias, biasfield)
+
+    return restore, biasfield
+
+
+def _normalize_bias_field(restore: str, biasfield: str, mask: str) -> None:
+    """Normalizes the N4 bias field to have a geometric mean of 1 within the
+    brain mask, and rescales the bias field corrected image accordingly
+    (in-place).
+
+    NOTE: N4 does not constrain the global gain of the bias field, so the
+        intensity scale of the bias field corrected image varies across
+        subjects. Normalizing the bias field keeps the intensity scale of the
+        bias field corrected image close to that of the input image.
+
+    Args:
+        restore: Bias field corrected image file.
+        biasfield: Bias field file.
+        mask: Brain mask file.
+    """
+    # NOTE: The images are read into memory (rather than memory-mapped), as
+    #   the (uncompressed) files are overwritten below.
+    bias: nib.Nifti1Image = nib.load(biasfield, mmap=False)
+    bias_arr: np.ndarray = bias.get_fdata(dtype=np.float32)
+    mask_arr: np.ndarray = np.asanyarray(nib.load(mask).dataobj) > 0
+
+    vals: np.ndarray = bias_arr[mask_arr & (bias_arr > 0)]
+
+    if vals.size == 0:
+        return None
+
+    g: float = float(np.exp(np.mean(np.log(vals))))
+
+    rest: nib.Nifti1Image = nib.load(restore, mmap=False)
+    rest_arr: np.ndarray = rest.get_fdata(dtype=np.float32)
+
+    bias_arr /= g
+    rest_arr *= g
+
+    for arr, img, fname in (
+        (bias_arr, bias, biasfield),
+        (rest_arr, rest, restore),
+    ):
+        _img: nib.Nifti1Image = nib.Nifti1Image(arr, img.affine, img.header)
+        _img.set_data_dtype(np.float32)
+        _img.to_filename(fname)
+    return None
+
+
+def _move(src: str, dst: str) -> str:
+    """Helper function that moves (renames) a file, or copies the file should 
+    ``src`` and ``dst`` reside on different file systems.
+
+    Args:
+        src: Input file.
+        dst: Destination file path.
+
+    Returns:
+        String that corresponds to the moved/copied file.
+    """
+    dst: str = os.path.abspath(dst)
+
+    if os.stat(src).st_dev == os.stat(os.path.dirname(dst)).st_dev:
+        os.replace(src, dst)
+        return dst
+
+    with File(src=src) as f:
+        return f.copy(dst)
+
+
+def _up_to_date(
+    src: str, *outputs: str, params_file: str, params: Dict[str, Any]
+) -> bool:
+    """Helper function that determines if output files exist, are newer than their input file, and were computed with the same parameters.
+
+    Args:
+        src: Input file.
+        *outputs: Output files.
+        params_file: JSON (sidecar) file of the parameters used to compute the output files (see ``_write_params``).
+        params: Parameters (e.g. method, and method specific options) used to compute the output files.
+
+    Returns:
+        True if all output files exist and are up to date, and False otherwise.
+    """
+    try:
+        with open(params_file, "r") as f:
+            if json.load(f) != params:
+                return False
+    except (OSError, ValueError):
+        return False
+
+    mtime: float = os.path.getmtime(src)
+    return all(
+        os.path.exists(output) and os.path.getmtime(output) >= mtime
+        for output in outputs
+    )
+
+
+def _file_params(file: str) -> Dict[str, Any]:
+    """Helper function that identifies the (input) file used to compute some output files, by its path, modification time, and size.
+
+    NOTE: The same key is used by ``niio`` to cache the validation of NIFTI files, such that a file replaced by a different file (with an older modification time, e.g. ``cp -p``) is not mistaken for the original file.
+
+    Args:
+        file: Input file.
+
+    Returns:
+        Dictionary of the path, modification time (in nanoseconds), and size of the file.
+    """
+    st: os.stat_result = os.stat(file)
+    return {
+        "image": file,
+        "image_mtime_ns": st.st_mtime_ns,
+        "image_size": st.st_size,
+    }
+
+
+def _write_params(params_file: str, params: Dict[str, Any]) -> str:
+    """Helper function that writes the parameters used to compute some output files to a JSON (sidecar) file.
+
+    Args:
+        params_file: Output JSON file.
+        params: Parameters used to compute the output files.
+
+    Returns:
+        String that corresponds to the JSON file.
+    """
+    with open(params_file, "w") as f:
+        json.dump(params, f, indent=4)
+    return params_file
+
+
+def _remove(file: str) -> None:
+    """Helper function that removes a file (if it exists)."""
+    try:
+        os.remove(file)
+    except FileNotFoundError:
+        pass
+    return None
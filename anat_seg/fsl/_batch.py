@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""Batch processing module.
+
+Runs (independent) invocations of the ``FSL`` wrappers concurrently, e.g.
+across subjects.
+"""
+import atexit
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from anat_seg.utils.commandio.commandio.logutil import LogFile
+
+# Shared (lazily created) process pool used by ``submit`` (see ``shutdown``)
+_EXECUTOR: Optional[ProcessPoolExecutor] = None
+_EXECUTOR_LOCK: threading.Lock = threading.Lock()
+
+
+def run_batch(
+    func: Callable[..., Any],
+    arg_list: List[Dict[str, Any]],
+    n_workers: Optional[int] = None,
+) -> List[Any]:
+    """Runs some function for each set of keyword arguments in a pool of
+    processes.
+
+    NOTE: Batch (rather than single) runs are CPU bound, so each worker
+        process is restricted to a single thread (see ``_init_worker``).
+
+    Usage example:
+        >>> from anat_seg.fsl.fast import fast
+        >>> run_batch(
+        ...     fast,
+        ...     [
+        ...         {"images": "sub-01_T1w.nii.gz", "out": "sub-01"},
+        ...         {"images": "sub-02_T1w.nii.gz", "out": "sub-02"},
+        ...     ],
+        ...     n_workers=2,
+        ... )
+
+    Args:
+        func: Function to be run. This function **MUST** be importable (i.e.
+            defined at the module level).
+        arg_list: List of keyword arguments for each invocation of ``func``.
+            Log files must be specified as file paths, rather than ``LogFile``
+            objects.
+        n_workers: Number of worker processes. Defaults to the number of CPUs
+            (or the number of invocations if fewer).
+
+    Returns:
+        List of the returned values of each invocation of ``func`` (in the
+            same order as ``arg_list``).
+    """
+    if n_workers is None:
+        n_workers: int = min(len(arg_list), os.cpu_count() or 1)
+
+    # NOTE: Process pool start-up is avoided for single (worker) runs.
+    if n_workers <= 1 or len(arg_list) <= 1:
+        return [func(**kwargs) for kwargs in arg_list]
+
+    with ProcessPoolExecutor(
+        max_workers=n_workers, initializer=_init_worker
+    ) as executor:
+        return list(
+            executor.map(
+                _apply, [(func, kwargs) for kwargs in arg_list], chunksize=1
+            )
+        )
+
+
+def submit(
+    func: Callable[..., Any],
+    threads: Optional[int] = None,
+    **kwargs: Any,
+) -> Future:
+    """Submits some function to be run (asynchronously) in a shared pool of
+    processes, such that independent stages (e.g. ``flirt`` and ``fast``) can
+    be run concurrently.
+
+    NOTE: The shared pool is shut down at exit, or may be shut down earlier
+        with ``shutdown``.
+
+    Usage example:
+        >>> from anat_seg.fsl.fast import fast
+        >>> from anat_seg.fsl.flirt import flirt
+        >>> f1 = submit(fast, images="brain.nii.gz", out="seg")
+        >>> f2 = submit(flirt, image="brain.nii.gz", ref="MNI.nii.gz", out="xfm", omat=True)
+        >>> seg, (xfm, mat) = f1.result(), f2.result()
+
+    Args:
+        func: Function to be run. This function **MUST** be importable (i.e.
+            defined at the module level).
+        threads: Number of (OpenMP) threads used by the ``FSL`` executables
+            run by ``func``. Defaults to None, in which case the threads are
+            not restricted.
+        kwargs: Keyword arguments for ``func``. A ``LogFile`` object (``log``)
+            is passed to the worker process as its file path.
+
+    Returns:
+        ``Future`` object of the returned value of ``func``.
+    """
+    global _EXECUTOR
+
+    # NOTE: LogFile objects hold (unpicklable) logging handlers, and are
+    #   re-created from the log file path in the worker process.
+    if isinstance(kwargs.get("log"), LogFile):
+        kwargs["log"] = kwargs["log"].src
+
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ProcessPoolExecutor()
+            atexit.register(shutdown)
+
+    return _EXECUTOR.submit(_apply_threads, func, threads, kwargs)
+
+
+def shutdown(wait: bool = True) -> None:
+    """Shuts down the shared pool of processes used by ``submit`` (which is
+    re-created by subsequent calls of ``submit``).
+
+    Args:
+        wait: Wait for the pending (submitted) functions to complete. Defaults
+            to True.
+    """
+    global _EXECUTOR
+
+    with _EXECUTOR_LOCK:
+        executor: Optional[ProcessPoolExecutor] = _EXECUTOR
+        _EXECUTOR = None
+
+    if executor is not None:
+        executor.shutdown(wait=wait)
+    return None
+
+
+def _init_worker() -> None:
+    """Process pool initializer that restricts the (OpenMP) threads used by
+    ``FSL`` executables in each worker process, so that the CPUs are not
+    oversubscribed.
+    """
+    os.environ["OMP_NUM_THREADS"] = "1"
+    return None
+
+
+def _apply(job: Tuple[Callable[..., Any], Dict[str, Any]]) -> Any:
+    """Helper function that calls a function with keyword arguments (in a
+    worker process).
+    """
+    func, kwargs = job
+    return func(**kwargs)
+
+
+def _apply_threads(
+    func: Callable[..., Any],
+    threads: Optional[int],
+    kwargs: Dict[str, Any],
+) -> Any:
+    """Helper function that calls a function with keyword arguments (in a
+    worker process), optionally restricting the (OpenMP) threads used by
+    ``FSL`` executables for the duration of the call.
+    """
+    if threads is None:
+        return func(**kwargs)
+
+    _threads: Optional[str] = os.environ.get("OMP_NUM_THREADS")
+    os.environ["OMP_NUM_THREADS"] = str(int(threads))
+    try:
+        return func(**kwargs)
+    finally:
+        if _threads is None:
+            os.environ.pop("OMP_NUM_THREADS", None)
+        else:
+            os.environ["OMP_NUM_THREADS"] = _threads
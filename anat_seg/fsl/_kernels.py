@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Compiled (``Numba``) kernels for the in-process ``fslmaths`` operations.
+
+NOTE: ``Numba`` is an optional dependency, and this module should only be
+    imported lazily (see ``fslmaths._run_inproc``), in which case the
+    ``scipy`` implementations are used should ``Numba`` not be installed.
+
+NOTE: The (parallel) kernels are not thread-safe, and **MUST** only be
+    imported and called from the main thread (see ``fslmaths._run_inproc``).
+"""
+import numpy as np
+from numba import njit, prange
+
+
+@njit(
+    "void(float32[:,:,:], float32[:,:,:], int64)",
+    parallel=True,
+    fastmath=True,
+    cache=True,
+)
+def fmean3d(src: np.ndarray, dst: np.ndarray, r: int) -> None:
+    """Box (mean) filter of a 3D image.
+
+    NOTE: Voxels outside of the image are ignored (as done by ``fslmaths``).
+
+    Args:
+        src: Input 3D image.
+        dst: Output 3D image (of the same shape as ``src``).
+        r: Kernel radius (e.g. 1 for a 3x3x3 kernel).
+    """
+    nx, ny, nz = src.shape
+    for z in prange(nz):
+        z0, z1 = max(z - r, 0), min(z + r + 1, nz)
+        for y in range(ny):
+            y0, y1 = max(y - r, 0), min(y + r + 1, ny)
+            for x in range(nx):
+                x0, x1 = max(x - r, 0), min(x + r + 1, nx)
+                acc = np.float32(0.0)
+                for k in range(z0, z1):
+                    for j in range(y0, y1):
+                        for i in range(x0, x1):
+                            acc += src[i, j, k]
+                dst[x, y, z] = acc / ((x1 - x0) * (y1 - y0) * (z1 - z0))
+
+
+@njit(
+    "void(float32[:,:,:], float32[:,:,:], int64)",
+    parallel=True,
+    cache=True,
+)
+def fmedian3d(src: np.ndarray, dst: np.ndarray, r: int) -> None:
+    """Median filter of a 3D image.
+
+    NOTE: Voxels outside of the image are replaced with the nearest voxel
+        (i.e. ``mode='nearest'`` of ``scipy.ndimage.median_filter``).
+
+    Args:
+        src: Input 3D image.
+        dst: Output 3D image (of the same shape as ``src``).
+        r: Kernel radius (e.g. 1 for a 3x3x3 kernel).
+    """
+    nx, ny, nz = src.shape
+    w = 2 * r + 1
+    n = w * w * w
+    for z in prange(nz):
+        buf = np.empty(n, dtype=np.float32)
+        for y in range(ny):
+            for x in range(nx):
+                m = 0
+                for k in range(z - r, z + r + 1):
+                    kk = min(max(k, 0), nz - 1)
+                    for j in range(y - r, y + r + 1):
+                        jj = min(max(j, 0), ny - 1)
+                        for i in range(x - r, x + r + 1):
+                            ii = min(max(i, 0), nx - 1)
+                            # Insertion sort (of the neighbourhood)
+                            v = src[ii, jj, kk]
+                            p = m
+                            while p > 0 and buf[p - 1] > v:
+                                buf[p] = buf[p - 1]
+                                p -= 1
+                            buf[p] = v
+                            m += 1
+                dst[x, y, z] = buf[n // 2]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Ahead-of-time (AOT) compilation of the in-process ``fslmaths`` kernels.
+
+Builds the ``_anat_kernels`` extension module (in this directory) from the
+kernels of ``_kernels``, which can then be used by ``fslmaths._run_inproc``
+without ``Numba`` (i.e. without JIT compilation) at run time.
+
+Usage example:
+    $ python -m anat_seg.fsl._kernels_aot
+
+NOTE:
+    * ``Numba`` (and a C compiler) is only required to build the extension
+        module.
+    * AOT compiled kernels are not parallelized, and so the (cached) JIT
+        compiled kernels are used in preference should ``Numba`` be installed.
+"""
+import os
+
+from numba.pycc import CC
+
+from anat_seg.fsl import _kernels
+
+# NOTE: The signatures are those of the JIT compiled kernels.
+_SIG: str = "void(f4[:,:,:], f4[:,:,:], i8)"
+
+cc: CC = CC("_anat_kernels")
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+cc.export("fmean3d", _SIG)(_kernels.fmean3d.py_func)
+cc.export("fmedian3d", _SIG)(_kernels.fmedian3d.py_func)
+
+
+if __name__ == "__main__":
+    cc.compile()
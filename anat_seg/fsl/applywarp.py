@@ -4,29 +4,23 @@
 This module is a wrapper for ``FSL``'s ``applywarp``.
 """
 import os
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 
-from anat_seg.utils.commandio.commandio.command import Command
+from anat_seg.utils.commandio.commandio.fileio import File
 from anat_seg.utils.commandio.commandio.logutil import LogFile
-from anat_seg.utils.commandio.commandio.tmpfile import TmpFile
-from anat_seg.utils.commandio.commandio.util import timeops
-from anat_seg.utils.niio import NiiFile
+from anat_seg.utils.niio import fsl_ext, nii_abspath, rm_nii_ext
+from anat_seg.fsl.convertwarp import convertwarp
+from anat_seg.utils.util import check_dependency, lazy_timeops, run_command
 
 
-# Globlally define (temporary) log file object
-# NOTE: Not the best practice in this scenario, but
-#   it gets the job done.
-with TmpFile(tmp_dir=os.getcwd(), ext=".log") as tmpf:
-    log: LogFile = LogFile(log_file=tmpf.src)
-    tmpf.remove()
-
-
-@timeops(log=log)
+@lazy_timeops
 def applywarp(
     image: str,
     ref: str,
     out: str,
     warp: Optional[str] = None,
+    premat: Optional[str] = None,
     abs: bool = False,
     rel: bool = False,
     log: Optional[LogFile] = None,
@@ -38,6 +32,7 @@ def applywarp(
         ref: Reference (target) image.
         out: Output transformed image.
         warp: Warp field. Defaults to None.
+        premat: Pre-xfm linear-xfm matrix. Defaults to None.
         abs: use absolute warp convention (default): x' = w(x). Defaults to False.
         rel: use relative warp convention: x' = x + w(x). Defaults to False.
         log: Log file object. Defaults to None.
@@ -45,30 +40,153 @@ def applywarp(
     Returns:
         Transformed image.
     """
-    _sub_cmd: str = ""
+    _sub_cmd: List[str] = []
+
+    image: str = nii_abspath(image)
+    ref: str = nii_abspath(ref)
 
-    with NiiFile(src=image, assert_exists=True, validate_nifti=True) as im:
-        with NiiFile(src=ref, assert_exists=True, validate_nifti=True) as rf:
-            image: str = im.abspath()
-            ref: str = rf.abspath()
+    # NOTE: The output file extension is set by ``FSLOUTPUTTYPE``.
+    out: str = f"{rm_nii_ext(out)}{fsl_ext()}"
 
     if warp is not None:
-        with NiiFile(src=warp, assert_exists=True, validate_nifti=True) as wp:
-            warp: str = wp.abspath()
-            _sub_cmd: str = f"--warp={warp}"
+        warp: str = nii_abspath(warp)
+        _sub_cmd.append(f"--warp={warp}")
+
+    if premat is not None:
+        with File(src=premat, assert_exists=True) as pm:
+            premat: str = pm.abspath()
+            _sub_cmd.append(f"--premat={premat}")
 
     if bool(rel):
-        _sub_cmd: str = f"{_sub_cmd} --rel"
+        _sub_cmd.append("--rel")
     elif bool(abs):
-        _sub_cmd: str = f"{_sub_cmd} --abs"
+        _sub_cmd.append("--abs")
     else:
-        _sub_cmd: str = f"{_sub_cmd} --abs"
+        _sub_cmd.append("--abs")
+
+    cmd: List[str] = [
+        "applywarp",
+        "-v",
+        f"--in={image}",
+        f"--ref={ref}",
+        f"--out={out}",
+    ] + _sub_cmd
 
-    cmd: str = f"applywarp -v --in={image} --ref={ref} --out={out} {_sub_cmd}"
+    check_dependency("applywarp")
 
-    appwarp: Command = Command(cmd)
-    appwarp.check_dependency()
-    appwarp.run(log=log)
+    run_command(cmd, log=log)
 
     return out
 
+
+def applywarp_chained(
+    image: str,
+    ref: str,
+    out: str,
+    warps: List[str],
+    premat: Optional[str] = None,
+    abs: bool = False,
+    rel: bool = False,
+    log: Optional[LogFile] = None,
+) -> str:
+    """Applies a (pre-xfm) linear transform and/or non-linear ``FSL`` warp 
+    fields to some image in one resampling step.
+
+    A linear transform and one warp field are applied directly by 
+    ``applywarp``, without first combining them into a new warp field. 
+    ``convertwarp`` is only used in the case of two warp fields.
+
+    Usage example:
+        >>> applywarp_chained(image="template_gm.nii.gz",
+        ...                   ref="brain.nii.gz",
+        ...                   out="template-to-native_gm.nii.gz",
+        ...                   warps=["template-to-native_warp.nii.gz"],
+        ...                   rel=True)
+        ...
+        "template-to-native_gm.nii.gz"
+
+    Args:
+        image: Input image.
+        ref: Reference (target) image.
+        out: Output transformed image.
+        warps: List of (at most two) warp fields, in the order they are to be applied.
+        premat: Pre-xfm linear-xfm matrix. Defaults to None.
+        abs: use absolute warp convention (default): x' = w(x). Defaults to False.
+        rel: use relative warp convention: x' = x + w(x). Defaults to False.
+        log: Log file object. Defaults to None.
+
+    Raises:
+        ValueError: Exception that is raised if more than two warp fields are specified.
+
+    Returns:
+        Transformed image.
+    """
+    if len(warps) > 2:
+        raise ValueError(
+            f"At most two warp fields can be applied, but {len(warps)} were specified."
+        )
+    elif len(warps) == 2:
+        warp: str = convertwarp(
+            warp=warps[0],
+            out=f"{rm_nii_ext(out)}_warp{fsl_ext()}",
+            ref=ref,
+            warp2=warps[1],
+            premat=premat,
+            rel=rel,
+            abs=abs,
+            log=log,
+        )
+        premat: str = None
+    elif len(warps) == 1:
+        warp: str = warps[0]
+    else:
+        warp: str = None
+
+    return applywarp(
+        image=image,
+        ref=ref,
+        out=out,
+        warp=warp,
+        premat=premat,
+        abs=abs,
+        rel=rel,
+        log=log,
+    )
+
+
+def applywarp_many(
+    jobs: List[Dict[str, Any]], max_workers: Optional[int] = None
+) -> List[str]:
+    """Applies transforms to several images concurrently.
+
+    Each job corresponds to the keyword arguments of one ``applywarp_chained``
+    call.
+
+    NOTE: Each job runs ``applywarp`` as a separate (single-threaded) process,
+        so the jobs are dispatched from a thread pool.
+
+    Usage example:
+        >>> applywarp_many(jobs=[
+        ...     {"image": "gm.nii.gz", "ref": "brain.nii.gz", "out": "gm_xfm.nii.gz", "warps": ["warp.nii.gz"], "rel": True},
+        ...     {"image": "wm.nii.gz", "ref": "brain.nii.gz", "out": "wm_xfm.nii.gz", "warps": ["warp.nii.gz"], "rel": True},
+        ... ])
+        ...
+        ["gm_xfm.nii.gz", "wm_xfm.nii.gz"]
+
+    Args:
+        jobs: List of dictionaries of keyword arguments for ``applywarp_chained``.
+        max_workers: Maximum number of concurrent jobs. Defaults to None (the number of jobs, up to the number of CPUs).
+
+    Returns:
+        List of transformed images, in the same order as the input jobs.
+    """
+    # NOTE: No more threads than jobs are started. Log writes need not be
+    #   serialized (e.g. with a lock), as the ``logging`` handlers used by
+    #   ``LogFile`` objects are thread-safe.
+    if max_workers is None:
+        max_workers: int = min(len(jobs), os.cpu_count() or 1)
+
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        return list(
+            executor.map(lambda job: applywarp_chained(**job), jobs)
+        )
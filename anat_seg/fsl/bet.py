@@ -3,26 +3,14 @@
 
 This module is a wrapper for ``FSL``'s ``BET``.
 """
-import os
-from typing import Tuple, Union
+from typing import List, Tuple, Union
 
-from anat_seg.utils.commandio.commandio.command import Command
-from anat_seg.utils.commandio.commandio.fileio import File
 from anat_seg.utils.commandio.commandio.logutil import LogFile
-from anat_seg.utils.commandio.commandio.tmpfile import TmpFile
-from anat_seg.utils.commandio.commandio.util import timeops
-from anat_seg.utils.niio import NiiFile
+from anat_seg.utils.niio import fsl_ext, nii_abspath, rm_nii_ext
+from anat_seg.utils.util import check_dependency, lazy_timeops, run_command
 
 
-# Globlally define (temporary) log file object
-# NOTE: Not the best practice in this scenario, but
-#   it gets the job done.
-with TmpFile(tmp_dir=os.getcwd(), ext=".log") as tmpf:
-    log: LogFile = LogFile(log_file=tmpf.src)
-    tmpf.remove()
-
-
-@timeops(log=log)
+@lazy_timeops
 def bet(
     image: str,
     out: str,
@@ -50,26 +38,27 @@ def bet(
         Tuple of strings that corresponds to the skull-stripped image, and the 
             mask (if requested).
     """
-    with NiiFile(src=image, assert_exists=True, validate_nifti=True) as img:
-        image: str = img.abspath()
+    image: str = nii_abspath(image)
 
-    if out.endswith('.nii.gz') or out.endswith('.nii'):
-        with File(src=out) as f:
-            out: str = f.rm_ext()
+    out: str = rm_nii_ext(out)
+
+    # NOTE: The output file extension is set by ``FSLOUTPUTTYPE``.
+    ext: str = fsl_ext()
 
     frac_int: float = float(frac_int)
 
-    cmd: str = f"bet {image} {out} -f {frac_int} -v -R"
+    cmd: List[str] = ["bet", image, out, "-f", str(frac_int), "-v", "-R"]
 
     if mask:
-        cmd: str = f"{cmd} -m"
-        mask_img: str = f"{out}_mask.nii.gz"
+        cmd.append("-m")
+        mask_img: str = f"{out}_mask{ext}"
     else:
         mask_img: str = None
 
     # Run the command
-    bet: Command = Command(cmd)
-    bet.run(log=log)
+    check_dependency("bet")
+
+    run_command(cmd, log=log)
 
-    return f"{out}.nii.gz", mask_img
+    return f"{out}{ext}", mask_img
 
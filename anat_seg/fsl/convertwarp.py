@@ -3,26 +3,15 @@
 
 This module is a wrapper for ``FSL``'s ``convertwarp``.
 """
-import os
-from typing import Optional
+from typing import List, Optional, Union
 
-from anat_seg.utils.commandio.commandio.command import Command
 from anat_seg.utils.commandio.commandio.fileio import File
 from anat_seg.utils.commandio.commandio.logutil import LogFile
-from anat_seg.utils.commandio.commandio.tmpfile import TmpFile
-from anat_seg.utils.commandio.commandio.util import timeops
-from anat_seg.utils.niio import NiiFile
+from anat_seg.utils.niio import fsl_ext, nii_abspath, rm_nii_ext
+from anat_seg.utils.util import check_dependency, lazy_timeops, run_command
 
 
-# Globlally define (temporary) log file object
-# NOTE: Not the best practice in this scenario, but
-#   it gets the job done.
-with TmpFile(tmp_dir=os.getcwd(), ext=".log") as tmpf:
-    log: LogFile = LogFile(log_file=tmpf.src)
-    tmpf.remove()
-
-
-@timeops(log=log)
+@lazy_timeops
 def convertwarp(
     warp: str,
     out: str,
@@ -31,7 +20,7 @@ def convertwarp(
     premat: Optional[str] = None,
     rel: bool = False,
     abs: bool = False,
-    log: Optional[str] = None,
+    log: Union[str, LogFile] = None,
 ) -> str:
     """Converts/combines non-linear ``FSL`` warp fields into one warp field.
 
@@ -43,40 +32,46 @@ def convertwarp(
         premat: Pre-xfm linear-xfm matrix. Defaults to None.
         rel: use relative warp convention: x' = x + w(x). Defaults to False.
         abs: use absolute warp convention (default): x' = w(x). Defaults to False.
-        log: Log file object. Defaults to None.
+        log: ``LogFile`` object or path to log file. Defaults to None.
 
     Returns:
         Warp field
     """
-    _sub_cmd: str = ""
+    _sub_cmd: List[str] = []
 
-    with NiiFile(src=warp, assert_exists=True, validate_nifti=True) as wp:
-        with NiiFile(src=ref, assert_exists=True, validate_nifti=True) as rf:
-            warp: str = wp.abspath()
-            ref: str = rf.abspath()
+    warp: str = nii_abspath(warp)
+    ref: str = nii_abspath(ref)
+
+    # NOTE: The output file extension is set by ``FSLOUTPUTTYPE``.
+    out: str = f"{rm_nii_ext(out)}{fsl_ext()}"
 
     if warp2 is not None:
-        with NiiFile(src=warp2, assert_exists=True, validate_nifti=True) as wp:
-            warp2: str = wp.abspath()
-            _sub_cmd: str = f"--warp2={warp2}"
+        warp2: str = nii_abspath(warp2)
+        _sub_cmd.append(f"--warp2={warp2}")
 
     if premat is not None:
         with File(src=premat, assert_exists=True) as pm:
             premat: str = pm.abspath()
-            _sub_cmd: str = f"{_sub_cmd} --premat={premat}"
+            _sub_cmd.append(f"--premat={premat}")
 
     if bool(rel):
-        _sub_cmd: str = f"{_sub_cmd} --rel"
+        _sub_cmd.append("--rel")
     elif bool(abs):
-        _sub_cmd: str = f"{_sub_cmd} --abs"
+        _sub_cmd.append("--abs")
     else:
-        _sub_cmd: str = f"{_sub_cmd} --abs"
+        _sub_cmd.append("--abs")
+
+    cmd: List[str] = [
+        "convertwarp",
+        "-v",
+        f"--warp1={warp}",
+        f"--out={out}",
+        f"--ref={ref}",
+    ] + _sub_cmd
 
-    cmd: str = f"convertwarp -v --warp1={warp} --out={out} --ref={ref} {_sub_cmd}"
+    check_dependency("convertwarp")
 
-    convwarp: Command = Command(cmd)
-    convwarp.check_dependency()
-    convwarp.run(log=log)
+    run_command(cmd, log=log)
 
     return out
 
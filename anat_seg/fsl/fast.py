@@ -3,33 +3,31 @@
 
 This module is a wrapper for ``FSL``'s ``FAST``.
 """
-import os
-from glob import glob
-from typing import List, Union
+from __future__ import annotations
 
-from anat_seg.utils.commandio.commandio.command import Command
-from anat_seg.utils.commandio.commandio.fileio import File
-from anat_seg.utils.commandio.commandio.logutil import LogFile
-from anat_seg.utils.commandio.commandio.tmpfile import TmpFile
-from anat_seg.utils.commandio.commandio.util import timeops
-from anat_seg.utils.niio import NiiFile
+from concurrent.futures import Future
+from typing import Any, List, Optional, Tuple, Union
 
+from anat_seg.utils.commandio.commandio.logutil import LogFile
+from anat_seg.utils.niio import fsl_env, fsl_ext, nii_abspath, rm_nii_ext
+from anat_seg.utils.util import check_dependency, lazy_timeops, run_command
+from anat_seg.fsl._batch import run_batch, submit
 
-# Globlally define (temporary) log file object
-# NOTE: Not the best practice in this scenario, but
-#   it gets the job done.
-with TmpFile(tmp_dir=os.getcwd(), ext=".log") as tmpf:
-    log: LogFile = LogFile(log_file=tmpf.src)
-    tmpf.remove()
+# Supported segmentation backends (see ``fast``)
+_BACKENDS: Tuple[str, ...] = ("fsl", "gpu")
 
 
-@timeops(log=log)
+@lazy_timeops
 def fast(
     images: Union[str, List[str]],
     out: str,
     intype: int = 1,
     classes: int = 3,
     priors: List[str] = None,
+    pve: bool = True,
+    mixeltype: bool = True,
+    compress: Optional[bool] = None,
+    backend: str = "fsl",
     log: Union[str, LogFile] = None,
 ) -> List[str]:
     """Performs automated segmentation of NIFTI brain MR images.
@@ -57,50 +55,186 @@ def fast(
             * ``3``: PD - Proton Density
         classes: Number of tissue classes. Defaults to 3.
         priors: Alternative prior images input as a list (e.g. [ 'csf.nii.gz', 'gm.nii.gz', 'wm.nii.gz' ]).
+        pve: Perform partial volume estimation. If False, only the (hard) segmentation is performed (and output), which is considerably faster. Defaults to True.
+        mixeltype: Output the mixeltype image (``_mixeltype``) with the partial volume estimates. This is not supported by the GPU backend, in which case this must be False. Defaults to True.
+        compress: Compressed (``.nii.gz``) or uncompressed (``.nii``) outputs, e.g. uncompressed outputs for intermediate files. Defaults to None, in which case the ``FSLOUTPUTTYPE`` environment variable is used.
+        backend: Segmentation backend, either ``"fsl"`` or ``"gpu"`` (see ``fast_gpu``). The ``FSL`` backend is used (and a warning is logged) if a GPU is not available, for multi-channel segmentation, or for PD images. Defaults to "fsl".
         log: ``LogFile`` object or path to log file. Defaults to None.
 
+    Raises:
+        ValueError: Exception that is raised if ``backend`` is not supported, or if the mixeltype image is requested from the GPU backend.
+
     Returns:
-        List of files that correspond to segmentation outputs.
+        List of files that correspond to segmentation outputs, i.e. the
+            partial volume estimates of each class (``_pve_0`` ... ``_pve_N``),
+            the segmentation derived from these (``_pveseg``), and the
+            mixeltype image (``_mixeltype``, if ``mixeltype`` is True). If
+            ``pve`` is False, only the segmentation (``_seg``) is output.
     """
-    _sub_cmd: str = ""
+    _sub_cmd: List[str] = []
 
     if isinstance(images, str):
         images: List[str] = [images]
 
-    for i, image in enumerate(images):
-        with NiiFile(
-            src=image, assert_exists=True, validate_nifti=True
-        ) as img:
-            images[i] = img.abspath()
+    images: List[str] = [nii_abspath(image) for image in images]
 
     if priors is not None:
-        for i, prior in enumerate(priors):
-            with NiiFile(
-                src=prior, assert_exists=True, validate_nifti=True
-            ) as img:
-                priors[i] = img.abspath()
-
-        _sub_cmd: str = f"-A {' '.join(priors)}"
-
-    with File(src=out) as f:
-        out: str = f.rm_ext()
+        priors: List[str] = [nii_abspath(prior) for prior in priors]
+
+        _sub_cmd: List[str] = ["-A", *priors]
+
+    if backend not in _BACKENDS:
+        raise ValueError(
+            f"Unsupported backend {backend!r}. Supported backends: {_BACKENDS}"
+        )
+
+    if backend == "gpu" and pve and mixeltype:
+        raise ValueError(
+            "The GPU backend does not output the mixeltype image, "
+            "set mixeltype=False or use the FSL backend."
+        )
+
+    if isinstance(log, str):
+        log: LogFile = LogFile(log_file=log)
+
+    if backend == "gpu":
+        from anat_seg.fsl.fast_gpu import (
+            GPU_INTYPES,
+            fast_gpu,
+            gpu_available,
+        )
+
+        # NOTE: The FSL backend is used (as a fallback) for options that
+        #   are not supported by the GPU backend.
+        if len(images) != 1:
+            reason: Optional[str] = "multi-channel segmentation"
+        elif int(intype) not in GPU_INTYPES:
+            reason: Optional[str] = f"input image type {intype}"
+        elif not gpu_available():
+            reason: Optional[str] = "no GPU available"
+        else:
+            reason: Optional[str] = None
+
+        if reason is None:
+            return fast_gpu(
+                images=images,
+                out=out,
+                intype=intype,
+                classes=classes,
+                priors=priors,
+                pve=pve,
+                compress=compress,
+                log=log,
+            )
+        elif log:
+            log.warning(
+                f"GPU backend not used ({reason}), using the FSL backend."
+            )
+
+    out: str = rm_nii_ext(out)
 
     intype: int = int(intype)
     classes: int = int(classes)
 
     channels: int = len(images)
 
-    cmd: str = f"fast {_sub_cmd} -v --nobias --channels={channels} --class={classes} \
-        --type={intype} --out={out} {' '.join(images)}"
+    if not pve:
+        _sub_cmd.append("--nopve")
+
+    cmd: List[str] = [
+        "fast",
+        *_sub_cmd,
+        "-v",
+        "--nobias",
+        f"--channels={channels}",
+        f"--class={classes}",
+        f"--type={intype}",
+        f"--out={out}",
+        *images,
+    ]
+
+    check_dependency("fast")
+    run_command(cmd, log=log, env=fsl_env(compress))
+
+    ext: str = fsl_ext(compress)
 
-    fast: Command = Command(cmd)
-    fast.check_dependency()
-    fast.run(log=log)
+    if not pve:
+        return [f"{out}_seg{ext}"]
 
-    seg_list: List[str] = glob(f"{out}_pve*", recursive=False)
-    seg_list.sort()
-    _tmp: List[str] = glob(f"{out}_mixel*", recursive=False)
-    seg_list.append(' '.join(_tmp))
+    # NOTE: Output filenames are determined by the output prefix and the
+    #   number of classes, so the output directory does not need to be
+    #   searched (and sorted, which misorders 10+ classes).
+    seg_list: List[str] = [f"{out}_pve_{i}{ext}" for i in range(classes)]
+    seg_list.append(f"{out}_pveseg{ext}")
+
+    if mixeltype:
+        seg_list.append(f"{out}_mixeltype{ext}")
 
     return seg_list
 
+
+def fast_batch(
+    images_list: List[Union[str, List[str]]],
+    out_list: List[str],
+    n_workers: Optional[int] = None,
+    **kwargs: Any,
+) -> List[List[str]]:
+    """Performs automated segmentation of several (e.g. subjects') NIFTI brain
+    MR images concurrently.
+
+    See ``fast`` for details.
+
+    Usage example:
+        >>> fast_batch(
+        ...     ["sub-01_T1w.nii.gz", "sub-02_T1w.nii.gz"],
+        ...     ["sub-01", "sub-02"],
+        ...     n_workers=2,
+        ...     classes=3,
+        ... )
+
+    Args:
+        images_list: List of input image(s) for each ``fast`` invocation.
+        out_list: List of output prefixes for each ``fast`` invocation.
+        n_workers: Number of worker processes. Defaults to None.
+        kwargs: Keyword arguments shared by each ``fast`` invocation.
+
+    Raises:
+        ValueError: Raised if the number of inputs and outputs differ.
+
+    Returns:
+        List of the segmentation outputs of each ``fast`` invocation.
+    """
+    if len(images_list) != len(out_list):
+        raise ValueError(
+            "The number of input images and output prefixes must be the same."
+        )
+
+    return run_batch(
+        fast,
+        [
+            {"images": images, "out": out, **kwargs}
+            for images, out in zip(images_list, out_list)
+        ],
+        n_workers=n_workers,
+    )
+
+
+def fast_submit(
+    images: Union[str, List[str]],
+    out: str,
+    **kwargs: Any,
+) -> Future:
+    """Runs ``fast`` asynchronously (in a shared pool of processes), such
+    that it can be run concurrently with other (independent) stages.
+
+    See ``fast`` for details.
+
+    Args:
+        images: Input image OR list of input images as file paths.
+        out: Output prefix.
+        kwargs: Keyword arguments for ``fast`` (and ``submit``, e.g. ``threads``).
+
+    Returns:
+        ``Future`` object of the outputs of ``fast``.
+    """
+    return submit(fast, images=images, out=out, **kwargs)
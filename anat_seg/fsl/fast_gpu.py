@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""GPU accelerated brain segmentation module.
+
+This module is a ``PyTorch`` implementation of the hidden Markov random field
+(MRF) expectation-maximization (EM) segmentation used by ``FSL``'s ``FAST``
+(Zhang, Brady & Smith, 2001), for single channel T1w and T2w images. The
+outputs follow the naming of the ``FAST`` outputs.
+
+NOTE: ``PyTorch`` is an optional dependency, and is only required for this
+    module.
+"""
+import math
+from typing import List, Optional, Tuple, Union
+
+import nibabel as nib
+import numpy as np
+
+from anat_seg.utils.commandio.commandio.logutil import LogFile
+from anat_seg.utils.niio import fsl_ext, nii_abspath, rm_nii_ext
+from anat_seg.utils.util import lazy_timeops
+
+# Supported input image types (T1w and T2w, see ``fast_gpu``)
+GPU_INTYPES: Tuple[int, ...] = (1, 2)
+
+
+def gpu_available() -> bool:
+    """Checks if ``PyTorch`` is installed and a CUDA device is available.
+
+    Returns:
+        True if ``fast_gpu`` can be used on a GPU, False otherwise.
+    """
+    try:
+        import torch
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+
+@lazy_timeops
+def fast_gpu(
+    images: Union[str, List[str]],
+    out: str,
+    intype: int = 1,
+    classes: int = 3,
+    priors: Optional[List[str]] = None,
+    beta: float = 0.1,
+    iters: int = 30,
+    tol: float = 1e-4,
+    pve: bool = True,
+    compress: Optional[bool] = None,
+    device: Optional[str] = None,
+    log: Union[str, LogFile] = None,
+) -> List[str]:
+    """Performs automated segmentation of a NIFTI brain MR image on the GPU.
+
+    NOTE:
+        * The input image is expected to be skull-stripped and bias field
+            corrected (non-zero voxels are segmented).
+        * Without priors, the tissue classes are ordered as done by ``FAST``
+            for the input image type, i.e. by increasing mean intensity for
+            T1w images, and by decreasing mean intensity for T2w images (such
+            that CSF is the first class for both). With priors, the tissue
+            classes are in the same order as the priors.
+        * The partial volume estimates are approximated by the posterior
+            probabilities of each tissue class, and the segmentation
+            (``_pveseg``) is derived from these (as done by ``FAST``).
+        * The mixeltype image of ``FAST`` is **NOT** output (see ``fast``).
+
+    Usage example:
+        >>> fast_gpu("sub-01_T1w_brain.nii.gz", "sub-01", classes=3)
+
+    Args:
+        images: Input image (OR list with a single input image) as file path.
+        out: Output prefix.
+        intype: Input image type, either ``1`` (T1w) or ``2`` (T2w). Defaults to 1.
+        classes: Number of tissue classes. Defaults to 3.
+        priors: Prior images (one for each class) input as a list (e.g. [ 'csf.nii.gz', 'gm.nii.gz', 'wm.nii.gz' ]). Defaults to None.
+        beta: MRF neighbourhood weight (analogous to ``FAST``'s ``-H``). Defaults to 0.1.
+        iters: Maximum number of EM iterations. Defaults to 30.
+        tol: Convergence threshold (maximum change in posterior probability). Defaults to 1e-4.
+        pve: Output the partial volume estimates. If False, only the (hard) segmentation is output. Defaults to True.
+        compress: Compressed (``.nii.gz``) or uncompressed (``.nii``) outputs. Defaults to None, in which case the ``FSLOUTPUTTYPE`` environment variable is used.
+        device: ``PyTorch`` device. Defaults to "cuda" (if available, otherwise "cpu").
+        log: ``LogFile`` object or path to log file. Defaults to None.
+
+    Raises:
+        ValueError: Raised if more than one input image is specified, if the input image type is not supported, if the number of priors and classes differ, or if ``iters`` is less than 1.
+
+    Returns:
+        List of files that correspond to segmentation outputs, i.e. the
+            partial volume estimates of each class (``_pve_0`` ... ``_pve_N``),
+            and the segmentation derived from these (``_pveseg``). If ``pve``
+            is False, only the segmentation (``_seg``) is output.
+    """
+    import torch
+    import torch.nn.functional as F
+
+    if isinstance(images, str):
+        images: List[str] = [images]
+
+    if len(images) != 1:
+        raise ValueError("Only single channel segmentation is supported.")
+
+    classes: int = int(classes)
+    intype: int = int(intype)
+
+    if intype not in GPU_INTYPES:
+        raise ValueError(
+            f"Input image type {intype} is not supported. Supported types: {GPU_INTYPES}"
+        )
+
+    if priors is not None and len(priors) != classes:
+        raise ValueError("The number of priors and classes must be the same.")
+
+    iters: int = int(iters)
+
+    if iters < 1:
+        raise ValueError("The number of EM iterations must be at least 1.")
+
+    if isinstance(log, str):
+        log: LogFile = LogFile(log_file=log)
+
+    image: str = nii_abspath(images[0])
+
+    out: str = rm_nii_ext(out)
+
+    if device is None:
+        device: str = "cuda" if torch.cuda.is_available() else "cpu"
+
+    if log:
+        log.info(f"Running:\tGPU ({device}) FAST segmentation on {image}")
+
+    eps: float = 1e-6
+
+    img: nib.Nifti1Image = nib.load(image)
+    data = torch.as_tensor(
+        np.asarray(img.dataobj, dtype=np.float32), device=device
+    )
+    mask = data > 0
+
+    # Intensities are scaled to [0, 1] for numerical stability
+    x = data[mask]
+    x = (x - x.min()) / (x.max() - x.min()).clamp_min(eps)
+
+    # Initialize the class means (and class probabilities)
+    if priors is not None:
+        prior = torch.stack(
+            [
+                torch.as_tensor(
+                    np.asarray(
+                        nib.load(nii_abspath(p)).dataobj, dtype=np.float32
+                    ),
+                    device=device,
+                )[mask]
+                for p in priors
+            ],
+            dim=1,
+        ).clamp_min(eps)
+        prior /= prior.sum(dim=1, keepdim=True)
+        log_prior = prior.log()
+        mu = torch.einsum("nk,n->k", prior, x) / prior.sum(dim=0)
+    else:
+        log_prior = torch.full(
+            (1, classes), -math.log(classes), device=device
+        )
+        xs = x.sort().values
+        q = (torch.arange(classes, device=device) + 0.5) / classes
+        mu = xs[(q * (xs.numel() - 1)).long()]
+
+    var = torch.full((classes,), float(x.var()) / classes ** 2, device=device)
+
+    # 6-connected neighbourhood kernel (applied to each class separately)
+    kernel = torch.zeros((classes, 1, 3, 3, 3), device=device)
+    kernel[:, 0, 1, 1, 0] = kernel[:, 0, 1, 1, 2] = 1.0
+    kernel[:, 0, 1, 0, 1] = kernel[:, 0, 1, 2, 1] = 1.0
+    kernel[:, 0, 0, 1, 1] = kernel[:, 0, 2, 1, 1] = 1.0
+
+    vol = torch.zeros((classes,) + tuple(data.shape), device=device)
+    post = None
+
+    for _ in range(iters):
+        # E-step: Gaussian log-likelihood + log prior (+ MRF neighbourhood)
+        logit = (
+            -0.5 * (x[:, None] - mu) ** 2 / var
+            - 0.5 * var.log()
+            + log_prior
+        )
+
+        if post is not None and beta > 0:
+            vol[:, mask] = post.T
+            nb = F.conv3d(vol[None], kernel, padding=1, groups=classes)[0]
+            logit = logit + beta * nb[:, mask].T
+
+        _post = torch.softmax(logit, dim=1)
+
+        # M-step: Weighted means and variances of each class
+        nk = _post.sum(dim=0).clamp_min(eps)
+        mu = torch.einsum("nk,n->k", _post, x) / nk
+        var = (
+            torch.einsum("nk,nk->k", _post, (x[:, None] - mu) ** 2) / nk
+        ).clamp_min(eps)
+
+        converged: bool = (
+            post is not None and float((_post - post).abs().max()) < tol
+        )
+        post = _post
+
+        if converged:
+            break
+
+    # NOTE: Classes are ordered such that CSF is the first class (i.e. by
+    #   decreasing intensity for T2w images).
+    if priors is None:
+        order = torch.argsort(mu, descending=(intype == 2))
+        post = post[:, order]
+
+    # Write outputs
+    ext: str = fsl_ext(compress)
+    seg_list: List[str] = []
+    mask_np: np.ndarray = mask.cpu().numpy()
+
+    seg: np.ndarray = np.zeros(mask_np.shape, dtype=np.uint8)
+    seg[mask_np] = post.argmax(dim=1).cpu().numpy() + 1
+
+    if not pve:
+        return [_save(seg, img, f"{out}_seg{ext}")]
+
+    for k in range(classes):
+        pv: np.ndarray = np.zeros(mask_np.shape, dtype=np.float32)
+        pv[mask_np] = post[:, k].cpu().numpy()
+        seg_list.append(_save(pv, img, f"{out}_pve_{k}{ext}"))
+
+    seg_list.append(_save(seg, img, f"{out}_pveseg{ext}"))
+
+    return seg_list
+
+
+def _save(data: np.ndarray, img: nib.Nifti1Image, out: str) -> str:
+    """Helper function that writes an array to a NIFTI file, using the
+    geometry of some reference image.
+    """
+    _img: nib.Nifti1Image = nib.Nifti1Image(data, img.affine, img.header)
+    _img.set_data_dtype(data.dtype)
+    _img.to_filename(out)
+    return out
@@ -3,26 +3,19 @@
 
 This module is a wrapper for ``FSL``'s ``FLIRT``.
 """
-import os
-from typing import Optional, Tuple, Union
+from __future__ import annotations
+
+from concurrent.futures import Future
+from typing import Any, List, Optional, Tuple, Union
 
-from anat_seg.utils.commandio.commandio.command import Command
 from anat_seg.utils.commandio.commandio.fileio import File
 from anat_seg.utils.commandio.commandio.logutil import LogFile
-from anat_seg.utils.commandio.commandio.tmpfile import TmpFile
-from anat_seg.utils.commandio.commandio.util import timeops
-from anat_seg.utils.niio import NiiFile
-
-
-# Globlally define (temporary) log file object
-# NOTE: Not the best practice in this scenario, but
-#   it gets the job done.
-with TmpFile(tmp_dir=os.getcwd(), ext=".log") as tmpf:
-    log: LogFile = LogFile(log_file=tmpf.src)
-    tmpf.remove()
+from anat_seg.utils.niio import fsl_ext, nii_abspath, rm_nii_ext
+from anat_seg.utils.util import check_dependency, lazy_timeops, run_command
+from anat_seg.fsl._batch import run_batch, submit
 
 
-@timeops(log=log)
+@lazy_timeops
 def flirt(
     image: str,
     ref: str,
@@ -46,31 +39,125 @@ def flirt(
     Returns:
         Tuple of strings for the output linearly transformed image, and the output linear transformation matrix.
     """
-    _sub_cmd: str = ""
-
-    with NiiFile(src=image, assert_exists=True, validate_nifti=True) as im:
-        with NiiFile(src=ref, assert_exists=True, validate_nifti=True) as rf:
-            image: str = im.abspath()
-            ref: str = rf.abspath()
+    image: str = nii_abspath(image)
+    ref: str = nii_abspath(ref)
 
+    # NOTE: The output file extension is set by ``FSLOUTPUTTYPE``.
     if out is not None:
-        with NiiFile(src=out) as ot:
-            _out: str = ot.rm_ext()
-            _sub_cmd: str = f"-out {out}"
-
-    if bool(omat) and out:
-        omat: str = f"{_out}.mat"
-        _sub_cmd: str = f"{_sub_cmd} -omat {omat}"
-    elif bool(omat):
-        omat: str = f"xfm-linear_dof-{dof}.mat"
-    elif omat is not None:
-        with File(src=omat) as om:
-            _sub_cmd: str = f"{_sub_cmd} -omat {om.rm_ext()}.mat"
+        out: str = f"{rm_nii_ext(out)}{fsl_ext()}"
+
+    _sub_cmd, omat = _build_flirt_subcmd(out=out, omat=omat, dof=dof)
 
-    cmd: str = f"flirt -in {image} -ref {ref} -dof {dof} -v {_sub_cmd}"
+    cmd: List[str] = [
+        "flirt",
+        "-in",
+        image,
+        "-ref",
+        ref,
+        "-dof",
+        str(dof),
+        "-v",
+        *_sub_cmd,
+    ]
 
-    flirt: Command = Command(cmd)
-    flirt.check_dependency()
-    flirt.run(log=log)
+    check_dependency("flirt")
+    run_command(cmd, log=log)
 
     return out, omat
+
+
+def flirt_batch(
+    images: List[str],
+    refs: Union[str, List[str]],
+    outs: List[str],
+    n_workers: Optional[int] = None,
+    **kwargs: Any,
+) -> List[Tuple[str, str]]:
+    """Performs image linear registration of several (e.g. subjects') images
+    concurrently.
+
+    See ``flirt`` for details.
+
+    Args:
+        images: List of input images.
+        refs: Reference (target) image, or list of reference images (one for each input image).
+        outs: List of output image names.
+        n_workers: Number of worker processes. Defaults to None.
+        kwargs: Keyword arguments shared by each ``flirt`` invocation.
+
+    Raises:
+        ValueError: Raised if the number of inputs, references and outputs differ.
+
+    Returns:
+        List of the outputs of each ``flirt`` invocation.
+    """
+    if isinstance(refs, str):
+        refs: List[str] = [refs] * len(images)
+
+    if not (len(images) == len(refs) == len(outs)):
+        raise ValueError(
+            "The number of input, reference, and output images must be the same."
+        )
+
+    return run_batch(
+        flirt,
+        [
+            {"image": image, "ref": ref, "out": out, **kwargs}
+            for image, ref, out in zip(images, refs, outs)
+        ],
+        n_workers=n_workers,
+    )
+
+
+def flirt_submit(
+    image: str,
+    ref: str,
+    **kwargs: Any,
+) -> Future:
+    """Runs ``flirt`` asynchronously (in a shared pool of processes), such
+    that it can be run concurrently with other (independent) stages.
+
+    See ``flirt`` for details.
+
+    Args:
+        image: Input image.
+        ref: Reference (target) image.
+        kwargs: Keyword arguments for ``flirt`` (and ``submit``, e.g. ``threads``).
+
+    Returns:
+        ``Future`` object of the outputs of ``flirt``.
+    """
+    return submit(flirt, image=image, ref=ref, **kwargs)
+
+
+def _build_flirt_subcmd(
+    out: Optional[str], omat: Optional[Union[str, bool]], dof: int
+) -> Tuple[List[str], Optional[str]]:
+    """Helper function that constructs the output arguments of ``flirt``.
+
+    Args:
+        out: Output image name.
+        omat: Output transformation (xfm) matrix, or True to name it after ``out`` (or ``dof`` if ``out`` is not specified).
+        dof: Degrees of freedom.
+
+    Returns:
+        Tuple of the list of command line arguments, and the output linear transformation matrix (or None).
+    """
+    _sub_cmd: List[str] = []
+
+    if out is not None:
+        _sub_cmd.extend(["-out", out])
+
+    if isinstance(omat, str) and omat:
+        omat: str = f"{File(src=omat).rm_ext()}.mat"
+    elif omat and out is not None:
+        omat: str = f"{rm_nii_ext(out)}.mat"
+    elif omat:
+        omat: str = f"xfm-linear_dof-{dof}.mat"
+    else:
+        omat: Optional[str] = None
+
+    if omat is not None:
+        _sub_cmd.extend(["-omat", omat])
+
+    return _sub_cmd, omat
@@ -3,26 +3,25 @@
 
 This module is a wrapper for ``FSL``'s ``FNIRT``.
 """
-import os
-from typing import Optional, Tuple
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-from anat_seg.utils.commandio.commandio.command import Command
 from anat_seg.utils.commandio.commandio.fileio import File
 from anat_seg.utils.commandio.commandio.logutil import LogFile
-from anat_seg.utils.commandio.commandio.tmpfile import TmpFile
-from anat_seg.utils.commandio.commandio.util import timeops
-from anat_seg.utils.niio import NiiFile
-
+from anat_seg.utils.niio import fsl_env, fsl_ext, nii_abspath, rm_nii_ext
+from anat_seg.utils.util import check_dependency, lazy_timeops, run_command
+from anat_seg.fsl._batch import run_batch
 
-# Globlally define (temporary) log file object
-# NOTE: Not the best practice in this scenario, but
-#   it gets the job done.
-with TmpFile(tmp_dir=os.getcwd(), ext=".log") as tmpf:
-    log: LogFile = LogFile(log_file=tmpf.src)
-    tmpf.remove()
+# Optional outputs (flag name, output filename suffix)
+_OUTPUTS: Tuple[Tuple[str, str], ...] = (
+    ("iout", ""),
+    ("fout", "_field"),
+    ("cout", "_field_coeff"),
+)
 
 
-@timeops(log=log)
+@lazy_timeops
 def fnirt(
     image: str,
     ref: str,
@@ -31,6 +30,7 @@ def fnirt(
     iout: bool = False,
     fout: bool = False,
     cout: bool = False,
+    compress: Optional[bool] = None,
     log: Optional[LogFile] = None,
 ) -> Tuple[str, str, str]:
     """Performs image non-linear registration of two images using ``FSL``'s ``FNIRT``.
@@ -45,50 +45,87 @@ def fnirt(
         iout: Output transformation image. Defaults to False.
         fout: Output non-linear warp field. Defaults to False.
         cout: Output non-linear warp field coefficients. Defaults to False.
+        compress: Compressed (``.nii.gz``) or uncompressed (``.nii``) outputs. Defaults to None, in which case the ``FSLOUTPUTTYPE`` environment variable is used.
         log: Log file object. Defaults to None.
 
     Returns:
         Tuple of strings that correspond to: transformed image, warp field, warp field coefficients.
     """
-    _sub_cmd: str = ""
+    _sub_cmd: List[str] = []
 
-    with NiiFile(src=image, assert_exists=True, validate_nifti=True) as im:
-        with NiiFile(src=ref, assert_exists=True, validate_nifti=True) as rf:
-            image: str = im.abspath()
-            ref: str = rf.abspath()
+    image: str = nii_abspath(image)
+    ref: str = nii_abspath(ref)
 
     if aff is not None:
         with File(src=aff, assert_exists=True) as f:
             aff: str = f.abspath()
-            _sub_cmd: str = f"--aff={aff}"
+            _sub_cmd.append(f"--aff={aff}")
+
+    out: str = rm_nii_ext(out)
 
-    if out.endswith('.nii.gz') or out.endswith('.nii'):
-        with File(src=out) as f:
-            out: str = f.rm_ext()
+    ext: str = fsl_ext(compress)
+    outputs: Dict[str, Optional[str]] = {}
+    requested: Dict[str, bool] = {"iout": iout, "fout": fout, "cout": cout}
 
-    if bool(iout):
-        iout: str = f"{out}.nii.gz"
-        _sub_cmd: str = f"{_sub_cmd} --iout={iout}"
-    else:
-        iout: str = None
+    for name, suffix in _OUTPUTS:
+        if bool(requested[name]):
+            outputs[name] = f"{out}{suffix}{ext}"
+            _sub_cmd.append(f"--{name}={outputs[name]}")
+        else:
+            outputs[name] = None
 
-    if bool(fout):
-        fout: str = f"{out}_field.nii.gz"
-        _sub_cmd: str = f"{_sub_cmd} --fout={fout}"
-    else:
-        fout: str = None
+    cmd: List[str] = [
+        "fnirt",
+        f"--in={image}",
+        f"--ref={ref}",
+        "-v",
+        *_sub_cmd,
+    ]
 
-    if bool(cout):
-        cout: str = f"{out}_field_coeff.nii.gz"
-        _sub_cmd: str = f"{_sub_cmd} --cout={cout}"
-    else:
-        cout: str = None
+    check_dependency("fnirt")
+    run_command(cmd, log=log, env=fsl_env(compress))
 
-    cmd: str = f"fnirt --in={image} --ref={ref} -v {_sub_cmd}"
+    return outputs["iout"], outputs["fout"], outputs["cout"]
 
-    fnirt: Command = Command(cmd)
-    fnirt.check_dependency()
-    fnirt.run(log=log)
 
-    return iout, fout, cout
+def fnirt_batch(
+    images: List[str],
+    refs: Union[str, List[str]],
+    outs: List[str],
+    n_workers: Optional[int] = None,
+    **kwargs: Any,
+) -> List[Tuple[str, str, str]]:
+    """Performs image non-linear registration of several (e.g. subjects')
+    images concurrently.
 
+    See ``fnirt`` for details.
+
+    Args:
+        images: List of input images.
+        refs: Reference (target) image, or list of reference images (one for each input image).
+        outs: List of output prefixes.
+        n_workers: Number of worker processes. Defaults to None.
+        kwargs: Keyword arguments shared by each ``fnirt`` invocation.
+
+    Raises:
+        ValueError: Raised if the number of inputs, references and outputs differ.
+
+    Returns:
+        List of the outputs of each ``fnirt`` invocation.
+    """
+    if isinstance(refs, str):
+        refs: List[str] = [refs] * len(images)
+
+    if not (len(images) == len(refs) == len(outs)):
+        raise ValueError(
+            "The number of input, reference, and output images must be the same."
+        )
+
+    return run_batch(
+        fnirt,
+        [
+            {"image": image, "ref": ref, "out": out, **kwargs}
+            for image, ref, out in zip(images, refs, outs)
+        ],
+        n_workers=n_workers,
+    )
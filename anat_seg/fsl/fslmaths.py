@@ -3,36 +3,21 @@
 
 This module is a wrapper for ``FSL``'s ``fslmaths``.
 """
+from __future__ import annotations
+
+import numbers
 import os
+import threading
 from enum import Enum, unique
 
-from typing import Optional, Union
-
-try:
-    from typing_extensions import Self
-except ImportError:
-    class Self:
-        """Helper class meant to act as a place holder for
-        typing_extensions.Self class type hint.
-        """
-        pass
+from typing import Any, Callable, List, Optional, Tuple, Union
 
-from anat_seg.utils.commandio.commandio.command import Command
 from anat_seg.utils.commandio.commandio.logutil import LogFile
-from anat_seg.utils.commandio.commandio.tmpfile import TmpFile
-from anat_seg.utils.commandio.commandio.util import timeops
-from anat_seg.utils.niio import NiiFile
-
+from anat_seg.utils.niio import fsl_ext, nii_abspath, rm_nii_ext
+from anat_seg.utils.util import check_dependency, lazy_timeops, run_command
 
-# Globlally define (temporary) log file object
-# NOTE: Not the best practice in this scenario, but
-#   it gets the job done.
-with TmpFile(tmp_dir=os.getcwd(), ext=".log") as tmpf:
-    log: LogFile = LogFile(log_file=tmpf.src)
-    tmpf.remove()
 
-
-@timeops(log=log)
+@lazy_timeops
 class fslmaths:
     """``FSL`` wrapper class for the ``fslmaths`` utility binary executable.
 
@@ -48,24 +33,26 @@ class fslmaths:
             image: Input image.
             dt: Data type. Defaults to None.
         """
-        _sub_cmd: str = ""
+        _sub_cmd: List[str] = []
 
-        with NiiFile(
-            src=image, assert_exists=True, validate_nifti=True
-        ) as img:
-            image: str = img.abspath()
+        image: str = nii_abspath(image)
 
         if dt is not None:
-            dt: str = FSLDataType(dt).name
-            _sub_cmd: str = f"-dt {dt}"
+            dt: str = _data_type(dt)
+            _sub_cmd: List[str] = ["-dt", dt]
+
+        self._parts: List[str] = ["fslmaths", *_sub_cmd, image]
 
-        self._cmd: str = f"fslmaths {_sub_cmd} {image}"
+        # Record of operations (for in-process execution, see ``run``)
+        self._image: str = image
+        self._dt: Optional[str] = dt
+        self._ops: List[Tuple[str, Any]] = []
 
-    def thrP(self, num=Union[int, float]) -> Self:
+    def thrP(self, num: numbers.Real) -> fslmaths:
         """Threshold image by some percentage.
 
         Args:
-            num: Voxel intensity percentage to use for threshold. Defaults to Union[int,float].
+            num: Voxel intensity percentage to use for threshold.
 
         Raises:
             TypeError: Exception that is raised if ``num`` is not a number.
@@ -73,17 +60,18 @@ class fslmaths:
         Returns:
             Class instance of ``fslmaths``.
         """
-        if isinstance(num, int) or isinstance(num, float):
-            self._cmd: str = f"{self._cmd} -thrP {num}"
+        if isinstance(num, numbers.Real):
+            self._parts.extend(["-thrP", str(num)])
+            self._ops.append(("-thrP", num))
         else:
             raise TypeError(f"Input {num} is not a number.")
         return self
 
-    def thr(self, num=Union[int, float]) -> Self:
+    def thr(self, num: numbers.Real) -> fslmaths:
         """Threshold image by some value.
 
         Args:
-            num: Voxel intensity value to use for threshold. Defaults to Union[int,float].
+            num: Voxel intensity value to use for threshold.
 
         Raises:
             TypeError: Exception that is raised if ``num`` is not a number.
@@ -91,13 +79,14 @@ class fslmaths:
         Returns:
             Class instance of ``fslmaths``.
         """
-        if isinstance(num, int) or isinstance(num, float):
-            self._cmd: str = f"{self._cmd} -thr {num}"
+        if isinstance(num, numbers.Real):
+            self._parts.extend(["-thr", str(num)])
+            self._ops.append(("-thr", num))
         else:
             raise TypeError(f"Input {num} is not a number.")
         return self
 
-    def mask(self, image: str) -> Self:
+    def mask(self, image: str) -> fslmaths:
         """Mask image.
 
         Args:
@@ -106,13 +95,12 @@ class fslmaths:
         Returns:
             Class instance of ``fslmaths``.
         """
-        with NiiFile(
-            src=image, assert_exists=True, validate_nifti=True
-        ) as img:
-            self._cmd: str = f"{self._cmd} -mas {img.abspath()}"
+        image: str = nii_abspath(image)
+        self._parts.extend(["-mas", image])
+        self._ops.append(("-mas", image))
         return self
 
-    def ero(self, repeat: int = 1) -> Self:
+    def ero(self, repeat: int = 1) -> fslmaths:
         """Erode image.
 
         Args:
@@ -121,11 +109,11 @@ class fslmaths:
         Returns:
             Class instance of ``fslmaths``.
         """
-        for _ in range(repeat):
-            self._cmd: str = f"{self._cmd} -ero"
+        self._parts.extend(["-ero"] * int(repeat))
+        self._ops.extend([("-ero", None)] * int(repeat))
         return self
 
-    def fmean(self, repeat: int = 1) -> Self:
+    def fmean(self, repeat: int = 1) -> fslmaths:
         """Mean filtering, kernel weighted (conventionally used with gauss kernel)
 
         Args:
@@ -134,11 +122,11 @@ class fslmaths:
         Returns:
             Class instance of ``fslmaths``.
         """
-        for _ in range(repeat):
-            self._cmd: str = f"{self._cmd} -fmean"
+        self._parts.extend(["-fmean"] * int(repeat))
+        self._ops.extend([("-fmean", None)] * int(repeat))
         return self
 
-    def fmedian(self, repeat: int = 1) -> Self:
+    def fmedian(self, repeat: int = 1) -> fslmaths:
         """Median Filtering.
 
         Args:
@@ -147,11 +135,11 @@ class fslmaths:
         Returns:
             Class instance of ``fslmaths``.
         """
-        for _ in range(repeat):
-            self._cmd: str = f"{self._cmd} -fmedian"
+        self._parts.extend(["-fmedian"] * int(repeat))
+        self._ops.extend([("-fmedian", None)] * int(repeat))
         return self
 
-    def add(self, input: Union[int, float, str]) -> Self:
+    def add(self, input: Union[numbers.Real, str, os.PathLike]) -> fslmaths:
         """Add a value or NIFTI-1 image to another NIFTI-1 image file.
         
         Args:
@@ -163,20 +151,9 @@ class fslmaths:
         Returns:
             Class instance of ``fslmaths``.
         """
-        if isinstance(input, int) or isinstance(input, float):
-            self._cmd: str = f"{self._cmd} -add {input}"
-        elif isinstance(input, str):
-            with NiiFile(
-                src=input, assert_exists=True, validate_nifti=True
-            ) as img:
-                self._cmd: str = f"{self._cmd} -add {img.abspath()}"
-        else:
-            raise TypeError(
-                f"Input {input} is not an 'int', 'float' or 'string'."
-            )
-        return self
+        return self._binop("-add", input)
 
-    def sub(self, input: Union[int, float, str]) -> Self:
+    def sub(self, input: Union[numbers.Real, str, os.PathLike]) -> fslmaths:
         """Subtract a value or NIFTI-1 image to another NIFTI-1 image file.
         
         Args:
@@ -188,20 +165,9 @@ class fslmaths:
         Returns:
             Class instance of ``fslmaths``.
         """
-        if isinstance(input, int) or isinstance(input, float):
-            self._cmd: str = f"{self._cmd} -sub {input}"
-        elif isinstance(input, str):
-            with NiiFile(
-                src=input, assert_exists=True, validate_nifti=True
-            ) as img:
-                self._cmd: str = f"{self._cmd} -sub {img.abspath()}"
-        else:
-            raise TypeError(
-                f"Input {input} is not an 'int', 'float' or 'string'."
-            )
-        return self
+        return self._binop("-sub", input)
 
-    def mul(self, input: Union[int, float, str]) -> Self:
+    def mul(self, input: Union[numbers.Real, str, os.PathLike]) -> fslmaths:
         """Multiply a value or NIFTI-1 image to another NIFTI-1 image file.
         
         Args:
@@ -213,20 +179,9 @@ class fslmaths:
         Returns:
             Class instance of ``fslmaths``.
         """
-        if isinstance(input, int) or isinstance(input, float):
-            self._cmd: str = f"{self._cmd} -mul {input}"
-        elif isinstance(input, str):
-            with NiiFile(
-                src=input, assert_exists=True, validate_nifti=True
-            ) as img:
-                self._cmd: str = f"{self._cmd} -mul {img.abspath()}"
-        else:
-            raise TypeError(
-                f"Input {input} is not an 'int', 'float' or 'string'."
-            )
-        return self
+        return self._binop("-mul", input)
 
-    def div(self, input: Union[int, float, str]) -> Self:
+    def div(self, input: Union[numbers.Real, str, os.PathLike]) -> fslmaths:
         """Divide a NIFTI-1 image by another NIFTI-1 image file or value.
         
         Args:
@@ -238,13 +193,31 @@ class fslmaths:
         Returns:
             Class instance of ``fslmaths``.
         """
-        if isinstance(input, int) or isinstance(input, float):
-            self._cmd: str = f"{self._cmd} -div {input}"
-        elif isinstance(input, str):
-            with NiiFile(
-                src=input, assert_exists=True, validate_nifti=True
-            ) as img:
-                self._cmd: str = f"{self._cmd} -div {img.abspath()}"
+        return self._binop("-div", input)
+
+    def _binop(
+        self, flag: str, input: Union[numbers.Real, str, os.PathLike]
+    ) -> fslmaths:
+        """Helper method for binary operations (e.g. ``-add``), in which the
+        operand is a number or a NIFTI-1 image file.
+
+        Args:
+            flag: ``fslmaths`` operation flag (e.g. ``-add``).
+            input: Input NIFTI-1 file, or number.
+
+        Raises:
+            TypeError: Exception that is raised if ``input`` is not a number or a NIFTI-1 image file.
+
+        Returns:
+            Class instance of ``fslmaths``.
+        """
+        if isinstance(input, numbers.Real):
+            self._parts.extend([flag, str(input)])
+            self._ops.append((flag, input))
+        elif isinstance(input, (str, os.PathLike)):
+            image: str = nii_abspath(os.fspath(input))
+            self._parts.extend([flag, image])
+            self._ops.append((flag, image))
         else:
             raise TypeError(
                 f"Input {input} is not an 'int', 'float' or 'string'."
@@ -256,31 +229,224 @@ class fslmaths:
         out: str,
         odt: Optional[str] = None,
         log: Optional[LogFile] = None,
+        inproc: Optional[bool] = None,
     ):
         """Run fslmaths command with command line flags.
 
+        NOTE: The operations can be performed in-process (using ``nibabel`` and
+            ``scipy``), which avoids reading and writing (compressed) NIFTI
+            files for each process. The ``fslmaths`` executable is used should
+            any of the operations be unsupported (e.g. ``thrP``), or should
+            ``scipy`` not be installed.
+
         Args:
             out: Output image filename.
             odt: Output datatype. Defaults to None.
             log: Log file to be written to. Defaults to None.
+            inproc: Perform the operations in-process. Defaults to None, in which case the ``ANAT_SEG_INPROC`` environment variable is used (i.e. ``ANAT_SEG_INPROC=1``).
 
         Returns:
             NIFTI-1 image file.
         """
-        _sub_cmd: str = ""
+        _sub_cmd: List[str] = []
 
         if odt is not None:
-            odt: str = FSLDataType(odt).name
-            _sub_cmd: str = f"-odt {odt}"
+            odt: str = _data_type(odt)
+            _sub_cmd: List[str] = ["-odt", odt]
+
+        if inproc is None:
+            inproc: bool = os.environ.get("ANAT_SEG_INPROC", "0") == "1"
+
+        # NOTE: The output file extension is set by ``FSLOUTPUTTYPE`` (for
+        #   both the in-process and ``fslmaths`` outputs).
+        out: str = f"{rm_nii_ext(out)}{fsl_ext()}"
+
+        if inproc and self._run_inproc(out=out, odt=odt, log=log):
+            return out
 
-        self._cmd: str = f"{self._cmd} {out} {_sub_cmd}"
+        # NOTE: The command is not modified, so that the same chain of
+        #   operations can be run more than once (e.g. with different outputs).
+        cmd: List[str] = [*self._parts, out, *_sub_cmd]
 
-        fslmaths: Command = Command(self._cmd)
-        fslmaths.check_dependency()
-        fslmaths.run(log=log)
+        check_dependency("fslmaths")
+        run_command(cmd, log=log)
 
         return out
 
+    def _run_inproc(
+        self,
+        out: str,
+        odt: Optional[str] = None,
+        log: Optional[LogFile] = None,
+    ) -> bool:
+        """Helper method that performs the (recorded) operations in-process.
+
+        NOTE:
+            * The (3x3x3 box) ``ero`` and ``fmean`` operations are computed
+                as done by ``fslmaths``, in which voxels outside of the image
+                are ignored.
+            * The ``fmedian`` operation instead replaces voxels outside of
+                the image with the nearest voxel, and so can differ from
+                ``fslmaths`` at the borders of the image.
+            * The ``fmean`` and ``fmedian`` operations use compiled
+                (``Numba``) kernels if available (see ``_kernels`` and
+                ``_kernels_aot``), and only in the main thread.
+
+        Args:
+            out: Output image filename.
+            odt: Output datatype. Defaults to None.
+            log: Log file to be written to. Defaults to None.
+
+        Returns:
+            True if the operations were performed, False otherwise (i.e. unsupported operations).
+        """
+        if any(op not in _INPROC_OPS for op, _ in self._ops):
+            return False
+
+        try:
+            from scipy import ndimage
+        except ImportError:
+            return False
+
+        import nibabel as nib
+        import numpy as np
+
+        # NOTE:
+        #   * The (AOT compiled) ``_anat_kernels`` extension module is
+        #       used should ``Numba`` not be installed (see ``_kernels_aot``).
+        #   * The (parallel) compiled kernels are not thread-safe, and can
+        #       cause the interpreter to hang on exit if run (or compiled)
+        #       outside of the main thread. The ``scipy`` implementations
+        #       are used in other threads.
+        _kernels = None
+        if threading.current_thread() is threading.main_thread():
+            try:
+                from anat_seg.fsl import _kernels
+            except ImportError:
+                try:
+                    from anat_seg.fsl import _anat_kernels as _kernels
+                except ImportError:
+                    _kernels = None
+
+        if isinstance(log, str):
+            log: LogFile = LogFile(log_file=log)
+
+        if log:
+            _cmd: str = " ".join(self._parts[1:])
+            log.info(f"Running:\tfslmaths (in-process) {_cmd} {out}")
+
+        # NOTE: The input image is read (and cast) in one step, as
+        #   an (in-memory) copy that is modified in place by the operations.
+        #   The copy is contiguous, in the (Fortran) order of NIFTI files
+        #   (i.e. no additional copy is made).
+        img: nib.Nifti1Image = nib.load(self._image, mmap=False)
+        dtype: type = np.float64 if self._dt == "double" else np.float32
+        arr: np.ndarray = np.asfortranarray(
+            np.asarray(img.dataobj, dtype=dtype)
+        )
+
+        # Kernel (3x3x3 box, applied to each volume of 4D images)
+        size: Tuple[int, ...] = (3,) * min(arr.ndim, 3) + (1,) * max(
+            arr.ndim - 3, 0
+        )
+
+        for op, arg in self._ops:
+            # NOTE:
+            #   * 3D images are applied to each volume of 4D images.
+            #   * Image operands are only read, and so are memory-mapped
+            #       (if uncompressed) rather than copied.
+            if isinstance(arg, str):
+                arg: np.ndarray = np.asarray(
+                    nib.load(arg, mmap=True).dataobj, dtype=dtype
+                )
+                arg: np.ndarray = arg.reshape(
+                    arg.shape + (1,) * (arr.ndim - arg.ndim)
+                )
+
+            if op == "-add":
+                np.add(arr, arg, out=arr)
+            elif op == "-sub":
+                np.subtract(arr, arg, out=arr)
+            elif op == "-mul":
+                np.multiply(arr, arg, out=arr)
+            elif op == "-div":
+                # NOTE: Division by zero results in zero (as in fslmaths).
+                np.divide(arr, arg, out=arr, where=(arg != 0))
+                arr[np.broadcast_to(arg == 0, arr.shape)] = 0
+            elif op == "-thr":
+                arr[arr < arg] = 0
+            elif op == "-mas":
+                arr[np.broadcast_to(arg <= 0, arr.shape)] = 0
+            elif op == "-ero":
+                arr[
+                    ~ndimage.binary_erosion(
+                        arr != 0, structure=np.ones(size), border_value=1
+                    )
+                ] = 0
+            elif op == "-fmean" and _kernels and arr.dtype == np.float32:
+                arr: np.ndarray = _apply_kernel(_kernels.fmean3d, arr)
+            elif op == "-fmean":
+                weights: np.ndarray = ndimage.uniform_filter(
+                    np.ones(arr.shape, dtype=dtype), size=size, mode="constant"
+                )
+                arr: np.ndarray = (
+                    ndimage.uniform_filter(arr, size=size, mode="constant")
+                    / weights
+                )
+            elif op == "-fmedian" and _kernels and arr.dtype == np.float32:
+                arr: np.ndarray = _apply_kernel(_kernels.fmedian3d, arr)
+            elif op == "-fmedian":
+                arr: np.ndarray = ndimage.median_filter(
+                    arr, size=size, mode="nearest"
+                )
+
+        # Output datatype (NOTE: defaults to that of the input image)
+        if odt is None or odt == "input":
+            out_dtype: np.dtype = img.get_data_dtype()
+        else:
+            out_dtype: np.dtype = np.dtype(_NP_DTYPES[odt])
+
+        if np.issubdtype(out_dtype, np.integer):
+            arr: np.ndarray = np.rint(arr)
+
+        _img: nib.Nifti1Image = nib.Nifti1Image(
+            arr.astype(out_dtype), img.affine, img.header
+        )
+        _img.set_data_dtype(out_dtype)
+        _img.to_filename(out)
+
+        return True
+
+
+def _apply_kernel(kernel: Callable[..., None], arr: Any) -> Any:
+    """Helper function that applies a (3x3x3) compiled kernel (see
+    ``_kernels``) to a 3D image, or to each volume of a 4D image.
+
+    Args:
+        kernel: Compiled kernel function (e.g. ``_kernels.fmean3d``).
+        arr: Input image array (``float32``).
+
+    Returns:
+        Filtered image array.
+    """
+    import numpy as np
+
+    # NOTE: The kernels iterate over the first (x) axis in the inner loop,
+    #   and so (contiguous) Fortran ordered arrays are used. Each volume of
+    #   a 4D image is then also contiguous.
+    arr: np.ndarray = np.asfortranarray(arr)
+    dst: np.ndarray = np.empty(arr.shape, dtype=arr.dtype, order="F")
+
+    if arr.ndim == 3:
+        kernel(arr, dst, 1)
+    else:
+        _src: np.ndarray = arr.reshape(arr.shape[:3] + (-1,), order="F")
+        _dst: np.ndarray = dst.reshape(arr.shape[:3] + (-1,), order="F")
+        for t in range(_src.shape[-1]):
+            kernel(_src[..., t], _dst[..., t], 1)
+
+    return dst
+
 
 @unique
 class FSLDataType(Enum):
@@ -296,3 +462,51 @@ class FSLDataType(Enum):
     float: str = "float"
     double: str = "double"
     input: str = "input"
+
+
+# Operations that can be performed in-process (see ``fslmaths.run``)
+_INPROC_OPS: frozenset = frozenset(
+    {
+        "-add",
+        "-sub",
+        "-mul",
+        "-div",
+        "-thr",
+        "-mas",
+        "-ero",
+        "-fmean",
+        "-fmedian",
+    }
+)
+
+# NumPy equivalents of FSL data types
+_NP_DTYPES: dict = {
+    "char": "uint8",
+    "short": "int16",
+    "int": "int32",
+    "float": "float32",
+    "double": "float64",
+}
+
+# NOTE: Data types are validated against a set of names (see ``_data_type``),
+#   rather than via (the comparatively slower) ``FSLDataType`` lookup.
+_DTYPES: frozenset = frozenset(m.value for m in FSLDataType)
+
+
+def _data_type(dt: Union[str, FSLDataType]) -> str:
+    """Helper function that validates some ``FSL`` data type.
+
+    Args:
+        dt: Data type.
+
+    Raises:
+        ValueError: Exception that is raised if ``dt`` is not a valid ``FSL`` data type.
+
+    Returns:
+        Data type name.
+    """
+    if isinstance(dt, FSLDataType):
+        return dt.value
+    elif dt not in _DTYPES:
+        raise ValueError(f"{dt!r} is not a valid FSLDataType")
+    return dt
@@ -4,40 +4,34 @@
 This module is a wrapper for several of ``FSL``'s and ``ANTs``' executables.
 """
 import os
-from typing import Dict, List, Optional, Tuple, Union
-
-from utils.commandio.commandio.logutil import LogFile
-from utils.commandio.commandio.tmpfile import TmpFile
-from utils.commandio.commandio.workdir import WorkDir
-from utils.commandio.commandio.util import timeops
-from utils.niio import NiiFile
-from utils.util import get_UNC_neonate_atlas
-
-from biascorr import biascorr
-from fsl.bet import bet
-from fsl.fast import fast
-from fsl.flirt import flirt
-from fsl.fnirt import fnirt
-from fsl.applywarp import applywarp
-from fsl.convertwarp import convertwarp
-from fsl.fslmaths import fslmaths
-
-
-# Globlally define (temporary) log file object
-# NOTE: Not the best practice in this scenario, but
-#   it gets the job done.
-with TmpFile(tmp_dir=os.getcwd(), ext=".log") as tmpf:
-    log: LogFile = LogFile(log_file=tmpf.src)
-    tmpf.remove()
-
-
-@timeops(log=log)
+from typing import List, Optional, Tuple, Union
+
+from anat_seg.utils.commandio.commandio.logutil import LogFile
+from anat_seg.utils.commandio.commandio.workdir import WorkDir
+from anat_seg.utils.niio import fsl_output_type, gzip_nii
+from anat_seg.utils.util import (
+    cached_abspath,
+    get_UNC_neonate_atlas,
+    lazy_timeops,
+)
+
+from anat_seg.biascorr import biascorr
+from anat_seg.fsl.bet import bet
+from anat_seg.fsl.fast import fast
+from anat_seg.fsl.flirt import flirt
+from anat_seg.fsl.fnirt import fnirt
+from anat_seg.fsl.applywarp import applywarp_many
+from anat_seg.fsl.fslmaths import fslmaths
+
+
+@lazy_timeops
 def segmentation(
     image: str,
     out: str,
     frac_int: float = 0.5,
     N4: bool = False,
     nobias: bool = False,
+    force: bool = False,
     intype: int = 1,
     classes: int = 3,
     priors: List[str] = None,
@@ -55,6 +49,7 @@ def segmentation(
         frac_int: Fractional intensity threshold (0->1); smaller values give larger brain outline estimates. RECOMMENDED: 0.3 (for neonates). Defaults to 0.5.
         N4: Perform N4 bias field correction, otherwise perform FSL's bias field correction. Defaults to False.
         nobias: Do not perform bias field correction. Defaults to False.
+        force: Perform bias field correction, even if the (up to date) outputs already exist. Defaults to False.
         intype: Input image type. Defaults to 1.
             * ``1``: T1w
             * ``2``: T2w
@@ -74,6 +69,7 @@ def segmentation(
             frac_int=frac_int,
             N4=N4,
             nobias=nobias,
+            force=force,
             intype=intype,
             classes=classes,
             log=log,
@@ -86,6 +82,7 @@ def segmentation(
             frac_int=frac_int,
             N4=N4,
             nobias=nobias,
+            force=force,
             intype=intype,
             classes=classes,
             priors=priors,
@@ -100,6 +97,7 @@ def _seg(
     frac_int: float = 0.5,
     N4: bool = False,
     nobias: bool = False,
+    force: bool = False,
     intype: int = 1,
     classes: int = 3,
     priors: List[str] = None,
@@ -115,6 +113,7 @@ def _seg(
         frac_int: Fractional intensity threshold (0->1); smaller values give larger brain outline estimates. Defaults to 0.5.
         N4: Perform N4 bias field correction, otherwise perform FSL's bias field correction. Defaults to False.
         nobias: Do not perform bias field correction. Defaults to False.
+        force: Perform bias field correction, even if the (up to date) outputs already exist. Defaults to False.
         intype: Input image type. Defaults to 1.
             * ``1``: T1w
             * ``2``: T2w
@@ -127,24 +126,34 @@ def _seg(
         List of strings that are files that correspond to segmentation outputs.
     """
     # Output working directory
-    outdir: str = os.path.abspath(out)
+    #
+    # NOTE: Output file paths are joined to the (absolute) output
+    #   directory path, which is only computed once.
+    outdir: str = cached_abspath(out)
 
     # TODO: Configure to use list of input images.
     #   * Multi-channel segmentation would likely yield
     #       better/more consistent results.
-    with WorkDir(src=outdir) as od:
+    #
+    # NOTE: Intermediate files are uncompressed (.nii), and only the
+    #   output segmentations are compressed (see ``gzip_nii``).
+    with WorkDir(src=outdir), fsl_output_type(compress=False):
         # Bias correct image
         if nobias:
             restore: str = image
         else:
             restore, _ = biascorr(
-                image=image, out=od.join('anat'), N4=N4, log=log
+                image=image,
+                out=os.path.join(outdir, 'anat'),
+                N4=N4,
+                force=force,
+                log=log,
             )
 
         # Mask brain
         brain, _ = bet(
             image=restore,
-            out=od.join('anat_brain.nii.gz'),
+            out=os.path.join(outdir, 'anat_brain.nii'),
             frac_int=frac_int,
             mask=True,
             log=log,
@@ -152,14 +161,14 @@ def _seg(
 
         seg_list: List[str] = fast(
             images=brain,
-            out=od.join('fast_segmentation'),
+            out=os.path.join(outdir, 'fast_segmentation'),
             intype=int(intype),
             classes=int(classes),
             priors=priors,
             log=log,
         )
 
-        return seg_list
+        return [gzip_nii(seg) for seg in seg_list]
 
 
 def _neo_seg(
@@ -168,6 +177,7 @@ def _neo_seg(
     frac_int: float = 0.3,
     N4: bool = False,
     nobias: bool = False,
+    force: bool = False,
     intype: int = 2,
     classes: int = 5,
     log: Optional[Union[str, LogFile]] = None,
@@ -183,6 +193,7 @@ def _neo_seg(
         frac_int: Fractional intensity threshold (0->1); smaller values give larger brain outline estimates. RECOMMENDED: 0.3 (for neonates). Defaults to 0.3.
         N4: Perform N4 bias field correction, otherwise perform FSL's bias field correction. Defaults to False.
         nobias: Do not perform bias field correction. Defaults to False.
+        force: Perform bias field correction, even if the (up to date) outputs already exist. Defaults to False.
         intype: Input image type. Defaults to 2.
             * ``1``: T1w
             * ``2``: T2w
@@ -194,24 +205,34 @@ def _neo_seg(
         List of strings that are files that correspond to: CSF, GM, WM, PVE segmentation and mixeltype NIFTI-1 image files.
     """
     # Output working directory
-    outdir: str = os.path.abspath(out)
+    #
+    # NOTE: Output file paths are joined to the (absolute) output
+    #   directory path, which is only computed once.
+    outdir: str = cached_abspath(out)
 
     # TODO: Configure to use list of input images.
     #   * Multi-channel segmentation would likely yield
     #       better/more consistent results.
-    with WorkDir(src=outdir) as od:
+    #
+    # NOTE: Intermediate files are uncompressed (.nii), and only the
+    #   output segmentations are compressed (see ``gzip_nii``).
+    with WorkDir(src=outdir), fsl_output_type(compress=False):
         # Bias correct image
         if nobias:
             restore: str = image
         else:
             restore, _ = biascorr(
-                image=image, out=od.join('anat'), N4=N4, log=log
+                image=image,
+                out=os.path.join(outdir, 'anat'),
+                N4=N4,
+                force=force,
+                log=log,
             )
 
         # Mask brain
         brain, _ = bet(
             image=restore,
-            out=od.join('anat_brain.nii.gz'),
+            out=os.path.join(outdir, 'anat_brain.nii'),
             frac_int=frac_int,
             mask=True,
             log=log,
@@ -232,7 +253,9 @@ def _neo_seg(
         _, lin_xfm_mat = flirt(
             image=template_brain,
             ref=brain,
-            out=od.join('template-to-native_space-native_xfm-linear.nii.gz'),
+            out=os.path.join(
+                outdir, 'template-to-native_space-native_xfm-linear.nii'
+            ),
             omat=True,
             dof=12,
             log=log,
@@ -243,8 +266,8 @@ def _neo_seg(
             image=template,
             ref=restore,
             aff=lin_xfm_mat,
-            out=od.join(
-                'template-to-native_space-native_xfm-nonlinear.nii.gz'
+            out=os.path.join(
+                outdir, 'template-to-native_space-native_xfm-nonlinear.nii'
             ),
             iout=True,
             fout=True,
@@ -252,58 +275,49 @@ def _neo_seg(
             log=log,
         )
 
-        ## Convert warps and incorporate linear transforms
-        nonlin_xfm_warp: str = convertwarp(
-            warp=nonlin_xfm_fout,
-            out=od.join('template-to-native_space-native_xfm-nonlinear_warp'),
-            ref=restore,
-            rel=True,
-            log=log,
+        ## Apply non-linear transforms to template files
+        gm_xfm: str = os.path.join(
+            outdir,
+            'template-to-native_space-native_xfm-nonlinear_tissue-gm.nii',
+        )
+        wm_xfm: str = os.path.join(
+            outdir,
+            'template-to-native_space-native_xfm-nonlinear_tissue-wm.nii',
+        )
+        csf_xfm: str = os.path.join(
+            outdir,
+            'template-to-native_space-native_xfm-nonlinear_tissue-csf.nii',
         )
 
-        ## Apply non-linear transforms to template files
-        tissues: Dict[str, str] = {
-            "gm": {
-                "template": template_gm,
-                "xfm": od.join(
-                    'template-to-native_space-native_xfm-nonlinear_tissue-gm.nii.gz'
-                ),
-            },
-            "wm": {
-                "template": template_wm,
-                "xfm": od.join(
-                    'template-to-native_space-native_xfm-nonlinear_tissue-wm.nii.gz'
-                ),
-            },
-            "csf": {
-                "template": template_csf,
-                "xfm": od.join(
-                    'template-to-native_space-native_xfm-nonlinear_tissue-csf.nii.gz'
-                ),
-            },
-        }
-
-        for tissue in tissues.keys():
-            _: str = applywarp(
-                image=tissues.get(tissue).get('template'),
-                ref=brain,
-                out=tissues.get(tissue).get('xfm'),
-                warp=nonlin_xfm_warp,
-                rel=True,
-                log=log,
-            )
+        # NOTE: The (relative) warp field is applied directly, rather than
+        #   first converting it to a new warp field with convertwarp.
+        gm_xfm, wm_xfm, csf_xfm = applywarp_many(
+            jobs=[
+                {
+                    "image": template_tissue,
+                    "ref": brain,
+                    "out": tissue_xfm,
+                    "warps": [nonlin_xfm_fout],
+                    "rel": True,
+                    "log": log,
+                }
+                for template_tissue, tissue_xfm in (
+                    (template_gm, gm_xfm),
+                    (template_wm, wm_xfm),
+                    (template_csf, csf_xfm),
+                )
+            ]
+        )
 
         ## Perform brain tissue segmentation
+        #
+        # NOTE: The priors are the tissue templates in native space.
         seg_list: List[str] = fast(
             images=brain,
-            out=od.join('fast_segmentation'),
+            out=os.path.join(outdir, 'fast_segmentation'),
             intype=int(intype),
             classes=int(classes),
-            priors=[
-                tissues.get('csf').get('template'),
-                tissues.get('gm').get('template'),
-                tissues.get('wm').get('template'),
-            ],
+            priors=[csf_xfm, gm_xfm, wm_xfm],
             log=log,
         )
 
@@ -315,34 +329,48 @@ def _neo_seg(
         pve0, pve1, pve2, pve3, _, pveseg, mixel = seg_list
 
         ### CSF
-        with NiiFile(src=pve0, assert_exists=True, validate_nifti=True) as pv:
-            csf: str = od.join(
-                'fast_segmentation_space-native_tissue-csf.nii.gz'
+        #
+        # NOTE: The FAST output is renamed (and is not re-validated).
+        csf: str = os.path.join(
+            outdir, 'fast_segmentation_space-native_tissue-csf.nii'
+        )
+        os.replace(pve0, csf)
+        if isinstance(log, LogFile):
+            log.log(f"Moving {pve0} to {csf}")
+
+        ### GM and WM
+        #
+        # NOTE:
+        #   Both chains are performed in-process (the fslmaths
+        #   executable is only used as a fallback), which avoids
+        #   reading and writing additional images.
+        #
+        #   The chains are run sequentially, as each (in-process)
+        #   chain is already multi-threaded, and the compiled
+        #   kernels must not be run from several threads at once.
+        gm: str = (
+            fslmaths(pve3)
+            .fmean()
+            .run(
+                out=os.path.join(
+                    outdir, 'fast_segmentation_space-native_tissue-gm.nii'
+                ),
+                log=log,
+                inproc=True,
             )
-            _: str = pv.move(csf)
-            if isinstance(log, LogFile):
-                log.log(f"Moving {pv.abspath()} to {csf}")
-
-        ### GM
-        with NiiFile(src=pve3, assert_exists=True, validate_nifti=True) as pv:
-            gm: str = fslmaths(pv.abspath()).fmean().run(
-                out=od.join('fast_segmentation_space-native_tissue-gm.nii.gz'),
+        )
+        wm: str = (
+            fslmaths(pve1)
+            .add(pve2)
+            .fmedian()
+            .run(
+                out=os.path.join(
+                    outdir, 'fast_segmentation_space-native_tissue-wm.nii'
+                ),
                 log=log,
+                inproc=True,
             )
+        )
 
-        ### WM
-        with NiiFile(src=pve1, assert_exists=True, validate_nifti=True) as pv1:
-            with NiiFile(
-                src=pve2, assert_exists=True, validate_nifti=True
-            ) as pv2:
-                wm: str = fslmaths(pv1.abspath()).add(
-                    pv2.abspath()
-                ).fmedian().run(
-                    out=od.join(
-                        'fast_segmentation_space-native_tissue-wm.nii.gz'
-                    ),
-                    log=log,
-                )
-
-        return [csf, gm, wm, pveseg, mixel]
+        return [gzip_nii(seg) for seg in (csf, gm, wm, pveseg, mixel)]
 
@@ -1,13 +1,26 @@
 # -*- coding: utf-8 -*-
 """Module IO methods for NIFTI files.
 """
+import gzip
 import os
+import shutil
+import struct
 import nibabel as nib
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Iterator, Optional, Tuple
 from warnings import warn
 
 from enum import Enum, unique
 
 from anat_seg.utils.commandio.commandio.fileio import File
+from anat_seg.utils.util import cached_abspath
+
+# NIFTI (and ANALYZE) file extensions
+_NII_EXTS: Tuple[str, ...] = (".nii.gz", ".nii", ".hdr", ".img")
+
+# Validate input NIFTI files (see ``nii_abspath``)
+VALIDATE_NIFTI: bool = os.environ.get("ANAT_SEG_VALIDATE", "1") != "0"
 
 
 class InvalidNiftiFileError(Exception):
@@ -116,7 +129,14 @@ class NiiFile(File):
                 self.src
             ), f"Input NIFTI file {self.src} does not exist."
 
-        if validate_nifti and os.path.exists(self.src):
+        # NOTE: Only the header is read (and checked) to validate the file.
+        #   The file is loaded with nibabel should the header check fail, in
+        #   which case nibabel determines if the file is valid.
+        if (
+            validate_nifti
+            and os.path.exists(self.src)
+            and not _valid_nifti_header(self.src)
+        ):
             try:
                 _: nib.Nifti1Image = nib.load(filename=self.src)
             except Exception as error:
@@ -171,3 +191,208 @@ class NiiFile(File):
                 )
             img.header['intent_name'] = txt
         return None
+
+
+def rm_nii_ext(src: str) -> str:
+    """Removes the NIFTI file extension (if any) from some file path.
+
+    Analogous to ``NiiFile(src).rm_ext()``, with the exception that no file
+    object is created.
+
+    Usage example:
+        >>> rm_nii_ext("file.nii.gz")
+        "file"
+
+    Args:
+        src: Path to NIFTI file.
+
+    Returns:
+        File path without the NIFTI file extension.
+    """
+    for ext in _NII_EXTS:
+        if src.endswith(ext):
+            return src[: -len(ext)]
+    return src
+
+
+def fsl_ext(compress: Optional[bool] = None) -> str:
+    """Returns the file extension of the NIFTI files written by ``FSL``.
+
+    Args:
+        compress: Compressed (``.nii.gz``) or uncompressed (``.nii``) NIFTI files. Defaults to None, in which case the ``FSLOUTPUTTYPE`` environment variable is used.
+
+    Returns:
+        NIFTI file extension.
+    """
+    if compress is None:
+        _type: str = os.environ.get("FSLOUTPUTTYPE", "NIFTI_GZ")
+        compress: bool = _type != "NIFTI"
+    return ".nii.gz" if compress else ".nii"
+
+
+def fsl_env(compress: Optional[bool] = None) -> Optional[Dict[str, str]]:
+    """Returns the environment variables that set the output file type of
+    ``FSL`` executables.
+
+    NOTE: Uncompressed outputs avoid the cost of compression (and subsequent
+        decompression) of intermediate files.
+
+    Args:
+        compress: Compressed (``.nii.gz``) or uncompressed (``.nii``) NIFTI files. Defaults to None, in which case the current environment is used.
+
+    Returns:
+        Dictionary of environment variables, or None.
+    """
+    if compress is None:
+        return None
+    return {"FSLOUTPUTTYPE": "NIFTI_GZ" if compress else "NIFTI"}
+
+
+@contextmanager
+def fsl_output_type(compress: bool = True) -> Iterator[None]:
+    """Context manager that (temporarily) sets the output file type of
+    ``FSL`` executables, which is restored on exit.
+
+    Usage example:
+        >>> with fsl_output_type(compress=False):
+        ...     fast("brain.nii", "seg")
+        ...
+
+    Args:
+        compress: Compressed (``.nii.gz``) or uncompressed (``.nii``) NIFTI files. Defaults to True.
+
+    Yields:
+        None
+    """
+    _type: Optional[str] = os.environ.get("FSLOUTPUTTYPE")
+    os.environ.update(fsl_env(compress))
+    try:
+        yield None
+    finally:
+        if _type is None:
+            os.environ.pop("FSLOUTPUTTYPE", None)
+        else:
+            os.environ["FSLOUTPUTTYPE"] = _type
+
+
+def gzip_nii(src: str, compresslevel: int = 1) -> str:
+    """Compresses an uncompressed (``.nii``) NIFTI file, which is removed.
+
+    NOTE: The (fastest) compression level of 1 is used by default, which is
+        also the default of ``nibabel``.
+
+    Usage example:
+        >>> gzip_nii("file.nii")
+        "file.nii.gz"
+
+    Args:
+        src: Path to NIFTI file. Compressed NIFTI files are left as is.
+        compresslevel: ``gzip`` compression level (1-9). Defaults to 1.
+
+    Returns:
+        Path to the compressed NIFTI file.
+    """
+    if not src.endswith(".nii"):
+        return src
+
+    out: str = f"{src}.gz"
+
+    with open(src, "rb") as f_in:
+        with gzip.open(out, "wb", compresslevel=compresslevel) as f_out:
+            shutil.copyfileobj(f_in, f_out, length=1 << 20)
+
+    os.remove(src)
+    return out
+
+
+def _valid_nifti_header(src: str) -> bool:
+    """Helper function that checks the header of some NIFTI-1 or NIFTI-2 file.
+
+    Only the header is read, i.e. the first 540 bytes of the (decompressed)
+    file. The header size, magic string, and number of dimensions are checked
+    for either byte order.
+
+    Args:
+        src: Path to NIFTI file.
+
+    Returns:
+        True if the NIFTI file header is valid, False otherwise.
+    """
+    opener: callable = gzip.open if src.endswith(".gz") else open
+
+    try:
+        with opener(src, "rb") as f:
+            hdr: bytes = f.read(540)
+    except (OSError, EOFError):
+        return False
+
+    if len(hdr) < 348:
+        return False
+
+    for endian in ("<", ">"):
+        sizeof_hdr: int = struct.unpack_from(f"{endian}i", hdr, 0)[0]
+
+        if sizeof_hdr == 348:
+            ndim: int = struct.unpack_from(f"{endian}h", hdr, 40)[0]
+            magic: bytes = hdr[344:348]
+            return magic in (b"n+1\x00", b"ni1\x00") and 1 <= ndim <= 7
+        elif sizeof_hdr == 540 and len(hdr) == 540:
+            ndim: int = struct.unpack_from(f"{endian}q", hdr, 16)[0]
+            magic: bytes = hdr[4:8]
+            return magic in (b"n+2\x00", b"ni2\x00") and 1 <= ndim <= 7
+
+    return False
+
+
+def nii_abspath(src: str) -> str:
+    """Returns the absolute path of an existing and valid NIFTI file.
+
+    Analogous to ``NiiFile(src, assert_exists=True, validate_nifti=True).abspath()``,
+    with the exception that each NIFTI file is only validated once (or again 
+    once modified).
+
+    NOTE: Validation can be skipped (e.g. for large batch runs) by setting the
+        environment variable ``ANAT_SEG_VALIDATE=0``, in which case only the
+        existence of the file is checked.
+
+    Usage example:
+        >>> nii_abspath("file.nii")
+        "abspath/to/file.nii"
+
+    Args:
+        src: Path to NIFTI file.
+
+    Raises:
+        InvalidNiftiFileError: Exception that is raised in the case **IF** the specified NIFTI file exists, but is an invalid NIFTI file.
+
+    Returns:
+        Absolute path of the NIFTI file.
+    """
+    if not (src.endswith(".nii.gz") or src.endswith(".nii")):
+        src: str = src + ".nii.gz"
+
+    src: str = cached_abspath(src)
+
+    assert os.path.exists(src), f"Input NIFTI file {src} does not exist."
+
+    if not VALIDATE_NIFTI:
+        return src
+
+    st: os.stat_result = os.stat(src)
+    return _validate_nifti(src, st.st_mtime_ns, st.st_size)
+
+
+@lru_cache(maxsize=1024)
+def _validate_nifti(src: str, mtime_ns: int, size: int) -> str:
+    """Helper function that validates some NIFTI file, the result of which is cached.
+
+    Args:
+        src: Absolute path to NIFTI file.
+        mtime_ns: Modification time of the NIFTI file (used as part of the cache key).
+        size: Size of the NIFTI file (used as part of the cache key).
+
+    Returns:
+        Absolute path of the NIFTI file.
+    """
+    _: NiiFile = NiiFile(src=src, assert_exists=True, validate_nifti=True)
+    return src
@@ -1,19 +1,243 @@
 # -*- coding: utf-8 -*-
 """Utility module.
 """
+import bz2
+import gzip
 import os
-from typing import Optional, Tuple, Union
+import shlex
+import shutil
+import subprocess
+import tarfile
+import tempfile
+from functools import lru_cache, wraps
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
 
 from anat_seg import ATLASDIR
 
-from anat_seg.utils.commandio.commandio.command import Command
+from anat_seg.utils.commandio.commandio.command import Command, DependencyError
 from anat_seg.utils.commandio.commandio.logutil import LogFile
-from anat_seg.utils.commandio.commandio.workdir import WorkDir
+from anat_seg.utils.commandio.commandio.util import timeops
+
+# NOTE: The atlas directory is normalized once (at import time).
+_ATLASDIR: str = os.fspath(ATLASDIR)
+
+# Tar archive file extensions (see ``extract``)
+_TAR_EXTS: Tuple[str, ...] = (".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar")
+
+# Cached UNC neonate atlas file paths (see ``get_UNC_neonate_atlas``)
+_ATLAS_CACHE: Optional[Tuple[str, ...]] = None
+
+
+@lru_cache(maxsize=1)
+def default_log() -> LogFile:
+    """Returns the (temporary) log file object shared by the modules of this package.
+
+    The log file object is created on first use, rather than at import time.
+
+    Returns:
+        ``LogFile`` object.
+    """
+    fd, tmp_log = tempfile.mkstemp(suffix=".log")
+    os.close(fd)
+    log: LogFile = LogFile(log_file=tmp_log)
+    os.remove(tmp_log)
+    return log
+
+
+def lazy_timeops(func: callable) -> callable:
+    """Decorator function analogous to ``timeops``, in which the log file 
+    object (see ``default_log``) is only created once the decorated 
+    function/class is called.
+
+    Usage example:
+        >>> @lazy_timeops
+        >>> def my_func(args*, log):
+        ...     for i in args:
+        ...         log.log(f"This is an arg: {i}")
+        ...     return None
+
+    Args:
+        func: Function/class to be timed.
+
+    Returns:
+        Callable function/class
+    """
+
+    @wraps(func)
+    def timed(*args, **kwargs) -> callable:
+        """Nested decorator function that performs timing of an operation."""
+        return timeops(log=default_log())(func)(*args, **kwargs)
+
+    return timed
+
+
+def cached_abspath(path: str) -> str:
+    """Returns the absolute path of some file or directory.
+
+    Analogous to ``os.path.abspath``, with the exception that the result is 
+    cached (for the current working directory).
+
+    Args:
+        path: Input file or directory path.
+
+    Returns:
+        Absolute path of the file or directory.
+    """
+    return _abspath(os.fspath(path), os.getcwd())
+
+
+@lru_cache(maxsize=4096)
+def _abspath(path: str, cwd: str) -> str:
+    """Helper function for ``cached_abspath``."""
+    return os.path.normpath(os.path.join(cwd, path))
+
+
+@lru_cache(maxsize=None)
+def which(exe: str) -> Optional[str]:
+    """Returns the path to some executable in the system path.
+
+    The system path lookup is performed once per executable (per process).
+
+    Args:
+        exe: Executable name.
+
+    Returns:
+        Path to the executable, or None if the executable is not in the system path.
+    """
+    return shutil.which(exe)
+
+
+def check_dependency(exe: str, raise_exc: bool = True) -> bool:
+    """Checks the dependency of some command line executable.
+
+    Analogous to ``Command.check_dependency``, with the exception that the 
+    system path is only searched once for each executable (see ``which``).
+
+    Args:
+        exe: Executable name.
+        raise_exc: If true, an exception is raised if the dependency is not in the system path. Defaults to True.
+
+    Raises:
+        DependencyError: Exception that is raised if the dependency is not met and ``raise_exc`` is True.
+
+    Returns:
+        Returns True if dependency is met, OR raises exception (if ``raise_exc`` is True)/ returns False otherwise.
+    """
+    if which(exe) is not None:
+        return True
+    elif raise_exc:
+        raise DependencyError(
+            f"Command executable not found in system path: {exe}"
+        )
+    else:
+        return False
+
+
+def clear_dependency_cache() -> None:
+    """Clears the cached system path lookups of ``which`` (and therefore
+    ``check_dependency``), e.g. after the system path is modified.
+    """
+    which.cache_clear()
+    return None
+
+
+def run_command(
+    command: Union[Command, List[str], str],
+    log: Optional[Union[LogFile, str]] = None,
+    raise_exc: bool = True,
+    env: Optional[Dict[str, str]] = None,
+) -> int:
+    """Executes (runs) a command from the command line, in which the standard
+    output and error of the command are written to the log file as they are
+    produced.
+
+    Analogous to ``Command.run``, with the exception that the output is 
+    streamed (line by line) to the log file, rather than buffered in memory 
+    until the command exits.
+
+    NOTE: The command is never executed via the shell. The executable is 
+        resolved to its full path so that, where available, the child process 
+        is launched with ``posix_spawn`` rather than ``fork`` + ``exec``.
+
+    Usage example:
+        >>> run_command(["echo", "Hi! I have arrived!"], log="file.log")
+        0
+
+    Args:
+        command: ``Command`` object, list of command line arguments, or ``str``.
+        log: ``LogFile`` object or ``str``. Defaults to None.
+        raise_exc: If true, raises ``RuntimeError`` exception if the return code of the command is not 0. Defaults to True.
+        env: Additional environment variables for the command. Defaults to None.
+
+    Raises:
+        RuntimeError: Exception that is raised if the return code of the command is not 0 and the ``raise_exc`` argument is set to ``True``.
+
+    Returns:
+        Return code for command execution.
+    """
+    _env: Dict[str, str] = dict(os.environ)
+
+    if isinstance(command, Command):
+        cmd: List[str] = shlex.split(
+            s=command.command, comments=False, posix=True
+        )
+        if command.env is not None:
+            _env.update(command.env)
+    elif isinstance(command, str):
+        cmd: List[str] = shlex.split(s=command, comments=False, posix=True)
+    else:
+        cmd: List[str] = [str(arg) for arg in command]
+
+    if env is not None:
+        _env.update(env)
+
+    _cmd: str = shlex.join(cmd)
+
+    exe: Optional[str] = which(cmd[0])
+    if exe is not None:
+        cmd[0] = exe
+
+    if isinstance(log, str):
+        log: LogFile = LogFile(log_file=log)
+
+    if log:
+        log.info(f"Running:\t{_cmd}")
+
+    # NOTE: File descriptors are non-inheritable by default (PEP 446), so
+    #   not closing them is safe, and is required for posix_spawn to be used.
+    with subprocess.Popen(
+        cmd,
+        env=_env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        bufsize=1,
+        text=True,
+        close_fds=False,
+    ) as p:
+        for line in p.stdout:
+            if log:
+                log.log(line.rstrip())
+
+    if p.returncode != 0:
+        if log:
+            log.error(f"Failed:\t{_cmd} with return code {p.returncode}")
+        if raise_exc:
+            raise RuntimeError(
+                f"\nFailed:\t{_cmd} with return code {p.returncode}\n"
+            )
+
+    return p.returncode
 
 
 def extract(file: str, /, log: Optional[Union[LogFile, str]] = None) -> None:
     """Extracts compressed file.
 
+    NOTE:
+        * Tar archives are extracted (in-process) into the directory of the archive.
+        * Single ``.gz``/``.bz2`` files are decompressed (in-process) in place, in which case the compressed file is removed (as done by ``gunzip``/``bunzip2``).
+        * Other (e.g. ``.zip``, ``.rar``, ``.7z``) files require the corresponding executable.
+
     Args:
         file: Input file (position only argument).
         log: Log file. Defaults to None.
@@ -24,50 +248,75 @@ def extract(file: str, /, log: Optional[Union[LogFile, str]] = None) -> None:
     Returns:
         None
     """
-    if file.endswith('.tar.bz2') or file.endswith('.tbz2'):
-        cmd: str = f"tar -xvjf {file}"
-    elif file.endswith('.tar.gz') or file.endswith('.tgz'):
-        cmd: str = f"tar -xvzf {file}"
-    elif file.endswith('.bz2'):
-        cmd: str = f"bunzip2 {file}"
+    if isinstance(log, str):
+        log: LogFile = LogFile(log_file=log)
+
+    if file.endswith(_TAR_EXTS):
+        if log:
+            log.info(f"Extracting:\t{file}")
+
+        with tarfile.open(file, mode="r:*") as tf:
+            # NOTE: The 'data' extraction filter is not available for all
+            #   versions of python.
+            if hasattr(tarfile, "data_filter"):
+                tf.extractall(os.path.dirname(file), filter="data")
+            else:
+                tf.extractall(os.path.dirname(file))
+        return None
+    elif file.endswith('.gz') or file.endswith('.bz2'):
+        if log:
+            log.info(f"Decompressing:\t{file}")
+
+        _open: callable = gzip.open if file.endswith('.gz') else bz2.open
+        out: str = file[: file.rindex('.')]
+
+        with _open(file, "rb") as src, open(out, "wb") as dst:
+            shutil.copyfileobj(src, dst, length=1 << 20)
+        os.remove(file)
+        return None
     elif file.endswith('.rar'):
-        cmd: str = f"unrar {file}"
-    elif file.endswith('.gz'):
-        cmd: str = f"gunzip {file}"
-    elif file.endswith('.tar'):
-        cmd: str = f"tar -xvf {file}"
+        cmd: List[str] = ["unrar", "x", file]
     elif file.endswith('.zip'):
-        cmd: str = f"unzip {file}"
+        cmd: List[str] = ["unzip", file]
     elif file.endswith('.7z'):
-        cmd: str = f"7z {file}"
+        cmd: List[str] = ["7z", "x", file]
     else:
         raise RuntimeError(f"Unable to extract/uncompress file: {file}")
 
-    uncompress: Command = Command(cmd)
-    uncompress.check_dependency()
-    uncompress.run(log=log)
+    check_dependency(cmd[0])
+    run_command(cmd, log=log)
 
     return None
 
 
 def get_UNC_neonate_atlas() -> Tuple[str, str, str, str, str]:
-    unc_atlas_dir: str = os.path.join(ATLASDIR, "UNC_infant_atlas_2020")
+    """Gets the UNC neonate atlas files, which are extracted on first use.
 
-    if os.path.exists(unc_atlas_dir):
-        with WorkDir(src=unc_atlas_dir) as ud:
-            template: str = ud.join(
-                'atlas', 'templates', 'infant-neo-withSkull.nii.gz'
-            )
-            template_brain: str = ud.join(
-                'atlas', 'templates', 'infant-neo-withCerebellum.nii.gz'
-            )
-            gm: str = ud.join('atlas', 'templates', 'infant-neo-seg-gm.nii.gz')
-            wm: str = ud.join('atlas', 'templates', 'infant-neo-seg-wm.nii.gz')
-            csf: str = ud.join(
-                'atlas', 'templates', 'infant-neo-seg-csf.nii.gz'
+    NOTE: The file paths are cached after the first call.
+
+    Returns:
+        Tuple of the template, template brain, GM, WM, and CSF atlas files.
+    """
+    global _ATLAS_CACHE
+
+    if _ATLAS_CACHE is not None:
+        return _ATLAS_CACHE
+
+    unc_atlas_dir: str = os.path.join(_ATLASDIR, "UNC_infant_atlas_2020")
+
+    if Path(unc_atlas_dir).is_dir():
+        _ATLAS_CACHE = tuple(
+            os.path.join(unc_atlas_dir, "atlas", "templates", fname)
+            for fname in (
+                "infant-neo-withSkull.nii.gz",
+                "infant-neo-withCerebellum.nii.gz",
+                "infant-neo-seg-gm.nii.gz",
+                "infant-neo-seg-wm.nii.gz",
+                "infant-neo-seg-csf.nii.gz",
             )
-        return template, template_brain, gm, wm, csf
+        )
+        return _ATLAS_CACHE
     else:
-        unc_zip_file: str = os.path.join(ATLASDIR, 'UNC.tar.gz')
+        unc_zip_file: str = os.path.join(_ATLASDIR, 'UNC.tar.gz')
         extract(unc_zip_file)
-        get_UNC_neonate_atlas()
+        return get_UNC_neonate_atlas()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Tests of the in-process ``fslmaths`` operations (see
+``fslmaths._run_inproc``) against ``scipy.ndimage``.
+
+Usage example:
+    $ python -m unittest discover -s tests
+"""
+import os
+import tempfile
+import threading
+import unittest
+
+import nibabel as nib
+import numpy as np
+from scipy import ndimage
+
+from anat_seg.fsl.fslmaths import fslmaths
+
+try:
+    from anat_seg.fsl import _kernels
+except ImportError:
+    _kernels = None
+
+
+def _fmean(arr: np.ndarray) -> np.ndarray:
+    """Reference 3x3x3 mean filter, in which voxels outside of the image are
+    ignored (as done by ``fslmaths``).
+    """
+    weights: np.ndarray = ndimage.uniform_filter(
+        np.ones(arr.shape), size=3, mode="constant"
+    )
+    return (
+        ndimage.uniform_filter(arr.astype(np.float64), size=3, mode="constant")
+        / weights
+    )
+
+
+def _fmedian(arr: np.ndarray) -> np.ndarray:
+    """Reference 3x3x3 median filter, in which voxels outside of the image are
+    replaced with the nearest voxel.
+    """
+    return ndimage.median_filter(arr, size=3, mode="nearest")
+
+
+def _ero(arr: np.ndarray) -> np.ndarray:
+    """Reference 3x3x3 erosion, in which voxels outside of the image are
+    ignored (as done by ``fslmaths``).
+    """
+    return arr * ndimage.binary_erosion(
+        arr != 0, structure=np.ones((3, 3, 3)), border_value=1
+    )
+
+
+class TestKernels(unittest.TestCase):
+    """Compiled (``Numba``) kernels, and the (Python) functions exported by
+    the AOT compiled kernels (see ``_kernels_aot``).
+    """
+
+    def setUp(self) -> None:
+        rng: np.random.Generator = np.random.default_rng(0)
+        self.arr: np.ndarray = np.asfortranarray(
+            rng.random((9, 7, 5), dtype=np.float32)
+        )
+
+    def _check(self, kernel, ref, arr: np.ndarray) -> None:
+        dst: np.ndarray = np.empty(arr.shape, dtype=np.float32, order="F")
+        kernel(arr, dst, 1)
+        # NOTE: The whole image is compared, including the borders (which
+        #   are handled as documented by the reference functions).
+        np.testing.assert_allclose(dst, ref(arr), rtol=1e-5, atol=1e-6)
+
+    @unittest.skipIf(_kernels is None, "Numba is not installed")
+    def test_fmean3d(self) -> None:
+        self._check(_kernels.fmean3d, _fmean, self.arr)
+
+    @unittest.skipIf(_kernels is None, "Numba is not installed")
+    def test_fmedian3d(self) -> None:
+        self._check(_kernels.fmedian3d, _fmedian, self.arr)
+
+    @unittest.skipIf(_kernels is None, "Numba is not installed")
+    def test_aot_fmean3d(self) -> None:
+        self._check(_kernels.fmean3d.py_func, _fmean, self.arr[:5, :4, :3])
+
+    @unittest.skipIf(_kernels is None, "Numba is not installed")
+    def test_aot_fmedian3d(self) -> None:
+        self._check(
+            _kernels.fmedian3d.py_func, _fmedian, self.arr[:5, :4, :3]
+        )
+
+
+class TestInproc(unittest.TestCase):
+    """In-process ``fslmaths`` operations, in the main thread (compiled
+    kernels, if available) and in other threads (``scipy``).
+    """
+
+    def setUp(self) -> None:
+        self._tmpdir: tempfile.TemporaryDirectory = (
+            tempfile.TemporaryDirectory()
+        )
+        self.tmpdir: str = self._tmpdir.name
+
+        rng: np.random.Generator = np.random.default_rng(0)
+        self.arr: np.ndarray = rng.random((9, 7, 5), dtype=np.float32)
+
+        # NOTE: Zeros are added for the erosion.
+        self.arr[self.arr < 0.2] = 0
+
+        self.image: str = os.path.join(self.tmpdir, "image.nii.gz")
+        nib.Nifti1Image(self.arr, np.eye(4)).to_filename(self.image)
+
+    def tearDown(self) -> None:
+        self._tmpdir.cleanup()
+
+    def _run(self, op: str, out: str) -> np.ndarray:
+        out: str = getattr(fslmaths(self.image), op)().run(
+            out=os.path.join(self.tmpdir, out), inproc=True
+        )
+        return np.asarray(nib.load(out).dataobj)
+
+    def _check(self, op: str, ref) -> None:
+        np.testing.assert_allclose(
+            self._run(op, f"{op}_main"), ref(self.arr), rtol=1e-5, atol=1e-6
+        )
+
+        # Other (i.e. non-main) thread
+        results: dict = {}
+        thread: threading.Thread = threading.Thread(
+            target=lambda: results.update(arr=self._run(op, f"{op}_thread"))
+        )
+        thread.start()
+        thread.join()
+        np.testing.assert_allclose(
+            results["arr"], ref(self.arr), rtol=1e-5, atol=1e-6
+        )
+
+    def test_fmean(self) -> None:
+        self._check("fmean", _fmean)
+
+    def test_fmedian(self) -> None:
+        self._check("fmedian", _fmedian)
+
+    def test_ero(self) -> None:
+        self._check("ero", _ero)
+
+
+if __name__ == "__main__":
+    unittest.main()